@@ -27,7 +27,8 @@ conf = dict(
     author='Niels Serup',
     author_email='ns@metanohi.org',
     packages=['shadowloss', 'shadowloss.builtinstickfigures', 'shadowloss.external'],
-    scripts=['scripts/shadowloss'],
+    scripts=['scripts/shadowloss', 'scripts/shadowloss-benchmark',
+             'scripts/shadowloss-solver', 'scripts/shadowloss-levelgen'],
     data_files=data,
     requires=['qvikconfig'],
     url='http://metanohi.org/projects/shadowloss/',
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.benchmark
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Measures how fast the important parts of the game are
+##[ Start date  ]## 2026 October 17
+
+# The benchmarks run without a window, using SDL's dummy drivers.
+# Every benchmark is a function that is called again and again; its
+# best and median time per call are saved as JSON together with
+# information about the machine, and can be compared with an earlier
+# result to find regressions. The drawing benchmarks are run once with
+# every renderer, drawing the same frames.
+
+import os
+import sys
+import json
+import math
+import time
+import fnmatch
+import shutil
+import platform
+import tempfile
+from optparse import OptionParser
+import shadowloss.various as various
+import shadowloss.generalinformation as ginfo
+from shadowloss.levelgen import LevelGenerator
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+LEVEL_UPDATE_SIZES = (10, 100, 1000, 10000, 100000)
+ZOOMS = (1, 2, 4)
+# Render scales tried at the largest zoom
+RENDER_SCALES = (1, 2)
+GHOST_COUNTS = (50, 200)
+RENDERERS = ('cairo', 'pygame', 'null')
+
+def measure(func, min_time=0.1, repeat=5):
+    """
+    Call func in batches which each take at least min_time seconds.
+    Returns the best and the median time per call.
+    """
+    number = 1
+    while True:
+        start = various.monotonic_time()
+        for i in xrange(number):
+            func()
+        spent = various.monotonic_time() - start
+        if spent >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(math.ceil(number * min_time / max(spent, 1e-9))))
+    times = []
+    for i in range(repeat):
+        start = various.monotonic_time()
+        for j in xrange(number):
+            func()
+        times.append((various.monotonic_time() - start) / number)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2],
+            'calls': number * repeat}
+
+class Environment(object):
+    """Files and game objects shared by the benchmarks"""
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.tmp_dir = tempfile.mkdtemp(prefix='shadowloss-benchmark-')
+        self.worlds = {}
+        # Renderers which cannot be created here, with the reason
+        import shadowloss.renderers as renderers
+        self.unavailable = {}
+        for name in RENDERERS:
+            try:
+                renderers.create(name)
+            except ImportError, e:
+                self.unavailable[name] = e
+
+    def level_path(self, objects):
+        path = os.path.join(self.tmp_dir, 'level-%d.shl' % objects)
+        if not os.path.exists(path):
+            LevelGenerator(objects, seed=0).save(path)
+        return path
+
+    def world(self, zoom=1, **options):
+        key = (zoom,) + tuple(sorted(options.items()))
+        name = options.get('renderer_name')
+        if name in self.unavailable:
+            raise ImportError('the %s renderer is not available: %s' % (
+                    name, self.unavailable[name]))
+        if key not in self.worlds:
+            from shadowloss.world import World
+            options = dict(options)
+            options.setdefault('levels', [self.level_path(100)])
+            world = World(data_dir=self.data_dir, disp_zoom=zoom, mute=True,
+                          term_verbose=False, use_level_cache=False,
+                          **options)
+            world.setup()
+            self.worlds[key] = world
+        return self.worlds[key]
+
+    def cleanup(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+def _bench_parse(path):
+    from shadowloss.external.qvikconfig import parse
+    return lambda: parse(path)
+
+def _bench_generate_body(name, cached):
+    from shadowloss.builtinstickfigures import stickfigures
+    from shadowloss.simulation import HeadlessParent
+    figure = stickfigures[name].create(HeadlessParent())
+    if cached:
+        figure.enable_pose_cache()
+        figure.pose_cache.bake(1.2)
+    state = [0.0]
+    def run():
+        state[0] = (state[0] + 7.3) % 1000
+        figure.generate_body(state[0], 1.2)
+    return run
+
+def _bench_draw_figure(env, name, renderer):
+    from shadowloss.builtinstickfigures import stickfigures
+    world = env.world(use_sprite_cache=False, renderer_name=renderer)
+    figure = stickfigures[name].create(world)
+    state = [0.0]
+    def run():
+        state[0] = (state[0] + 7.3) % 1000
+        figure.draw(state[0], 1.2, (255, 255, 255))
+        world.flush_shapes()
+    return run
+
+def _ghost_poses(count):
+    steps = [(i * 37.3) % 1000 for i in range(count)]
+    speeds = [0.5 + (i % 7) * 0.25 for i in range(count)]
+    return steps, speeds
+
+def _bench_pose_ghosts(count, batched):
+    from shadowloss.builtinstickfigures import stickfigures
+    from shadowloss.simulation import HeadlessParent
+    import shadowloss.ghosts as ghosts
+    figure = stickfigures['zorna'].create(HeadlessParent())
+    steps, speeds = _ghost_poses(count)
+    if batched:
+        if ghosts.numpy is None:
+            raise ImportError('no NumPy')
+        return lambda: ghosts.pose_many(figure, steps, speeds)
+    return lambda: ghosts.PoseList(figure, steps, speeds)
+
+def _bench_draw_ghosts(env, count, renderer):
+    from shadowloss.builtinstickfigures import stickfigures
+    world = env.world(renderer_name=renderer)
+    figure = stickfigures['zorna'].create(world)
+    steps, speeds = _ghost_poses(count)
+    shifts = [(i % 21 - 10) * 25.0 for i in range(count)]
+    state = [0.0]
+    def run():
+        state[0] = (state[0] + 7.3) % 1000
+        world.draw_ghosts(figure, shifts, [x + state[0] for x in steps],
+                          speeds, (96, 96, 96))
+        world.flush_shapes()
+    return run
+
+def _bench_create_text(env):
+    world = env.world()
+    texts = ['A', 'Bye', '0.5', 'cs', 'Q']
+    state = [0]
+    def run():
+        state[0] += 1
+        world.create_text(texts[state[0] % len(texts)], 75)
+    return run
+
+def _bench_level_update(env, objects):
+    from shadowloss.level import Level, PLAYING
+    from shadowloss.simulation import HeadlessParent
+    parent = HeadlessParent()
+    level = Level(parent, env.level_path(objects))
+    step = 1000.0 / 60
+    state = [0.0]
+    def run():
+        if level.status != PLAYING:
+            state[0] = 0.0
+            level.start(0.0)
+        state[0] += step
+        level.update([], state[0])
+    return run
+
+def _bench_world_draw(env, zoom, renderer, render_scale=None):
+    from shadowloss.level import PLAYING
+    world = env.world(zoom, renderer_name=renderer,
+                      render_scale=render_scale)
+    level = world.current_level
+    state = [0.0]
+    def run():
+        if level.status != PLAYING:
+            state[0] = 0.0
+            level.start(0.0)
+        state[0] += 1000.0 / 60
+        level.update([], state[0])
+        world.draw()
+    return run
+
+def benchmarks(env):
+    """Get (name, function creating the benchmark) pairs"""
+    levels_dir = os.path.join(env.data_dir, 'levels')
+    yield 'parse.small', lambda: _bench_parse(
+        os.path.join(levels_dir, 'tut4.shl'))
+    yield 'parse.huge', lambda: _bench_parse(env.level_path(20000))
+    for name in ('bob', 'zorna'):
+        yield 'generate_body.%s' % name, \
+            lambda name=name: _bench_generate_body(name, False)
+        yield 'generate_body.%s.cached' % name, \
+            lambda name=name: _bench_generate_body(name, True)
+        for r in RENDERERS:
+            yield 'stickfigure_draw.%s.%s' % (name, r), \
+                lambda name=name, r=r: _bench_draw_figure(env, name, r)
+    for n in GHOST_COUNTS:
+        yield 'ghosts.pose%d' % n, lambda n=n: _bench_pose_ghosts(n, True)
+        yield 'ghosts.pose%d.loop' % n, \
+            lambda n=n: _bench_pose_ghosts(n, False)
+        for r in RENDERERS:
+            yield 'ghosts.draw%d.%s' % (n, r), \
+                lambda n=n, r=r: _bench_draw_ghosts(env, n, r)
+    yield 'create_text', lambda: _bench_create_text(env)
+    for n in LEVEL_UPDATE_SIZES:
+        yield 'level_update.%d' % n, lambda n=n: _bench_level_update(env, n)
+    for zoom in ZOOMS:
+        for r in RENDERERS:
+            yield 'world_draw.zoom%d.%s' % (zoom, r), \
+                lambda zoom=zoom, r=r: _bench_world_draw(env, zoom, r)
+    for scale in RENDER_SCALES:
+        for r in RENDERERS:
+            yield 'world_draw.zoom%d.scale%d.%s' % (ZOOMS[-1], scale, r), \
+                lambda scale=scale, r=r: _bench_world_draw(
+                env, ZOOMS[-1], r, scale)
+
+def machine_info():
+    info = {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'shadowloss': ginfo.version_text,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sdl videodriver': os.environ.get('SDL_VIDEODRIVER'),
+        'sdl audiodriver': os.environ.get('SDL_AUDIODRIVER'),
+        }
+    try:
+        import multiprocessing
+        info['cpus'] = multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        pass
+    try:
+        import pygame
+        info['pygame'] = pygame.version.ver
+    except ImportError:
+        pass
+    return info
+
+def run(data_dir, patterns=None, min_time=0.1, repeat=5, out=sys.stdout):
+    env = Environment(data_dir)
+    results = {}
+    try:
+        for name, create in benchmarks(env):
+            if patterns and not [x for x in patterns
+                                 if fnmatch.fnmatch(name, x)]:
+                continue
+            try:
+                result = measure(create(), min_time, repeat)
+            except ImportError, e:
+                out.write('%-32s skipped (%s)\n' % (name, e))
+                continue
+            results[name] = result
+            out.write('%-32s %12.2f us (median %.2f us)\n' % (
+                    name, result['best'] * 1e6, result['median'] * 1e6))
+            out.flush()
+    finally:
+        env.cleanup()
+    return {'machine': machine_info(), 'results': results}
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Get (name, baseline time, current time, change) for every benchmark
+    that has become more than threshold slower
+    """
+    regressions = []
+    for name, result in sorted(current['results'].iteritems()):
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        change = result['best'] / old['best'] - 1
+        if change > threshold:
+            regressions.append((name, old['best'], result['best'], change))
+    return regressions
+
+def main(args=None):
+    parser = OptionParser(
+        prog=ginfo.program_name + '-benchmark',
+        usage='Usage: %prog [OPTION]... [PATTERN]...',
+        description='Measure the speed of the parts of shadowloss that \
+run in every frame. Only benchmarks matching one of the patterns (if \
+any) are run.')
+    parser.add_option('-d', '--data-dir', dest='data_dir', metavar='PATH',
+                      default=ginfo.global_data_dir,
+                      help='where the game data is')
+    parser.add_option('-o', '--output', dest='output', metavar='PATH',
+                      help='save the results as JSON')
+    parser.add_option('-c', '--compare', dest='baseline', metavar='PATH',
+                      help='compare with the results saved in PATH')
+    parser.add_option('-t', '--threshold', dest='threshold', type='float',
+                      default=0.1, metavar='FRACTION',
+                      help='how much slower a benchmark may become before \
+it counts as a regression (default 0.1)')
+    parser.add_option('-m', '--min-time', dest='min_time', type='float',
+                      default=0.1, metavar='SECONDS',
+                      help='the least time spent on each measurement \
+(default 0.1)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int',
+                      default=5, metavar='NUMBER',
+                      help='the number of measurements per benchmark')
+    options, patterns = parser.parse_args(args)
+
+    result = run(options.data_dir, patterns, options.min_time,
+                 options.repeat)
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(result, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+    if options.baseline:
+        f = open(options.baseline)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        regressions = compare(baseline, result, options.threshold)
+        for name, old, new, change in regressions:
+            print 'REGRESSION %-25s %10.2f us -> %10.2f us (+%.0f%%)' % (
+                name, old * 1e6, new * 1e6, change * 100)
+        if regressions:
+            return 1
+        print 'no regressions'
+    return 0
@@ -30,6 +30,18 @@ import math
 
 SURFACE = None
 
+# Shapes queued since the last flush. Each batch is a list of the form
+# [surface, kind, color, line_width, shapes]; consecutive shapes with
+# the same kind, color and line width share one batch (and thus one
+# cairo path), while the order between batches is kept so that
+# overlapping shapes are still drawn in the order they were queued.
+LINES = 1
+CIRCLES = 2
+_batches = []
+
+# Whether the edges of shapes are smoothed
+ANTIALIAS = True
+
 def set_screen(pygame_surf):
     global SURFACE
     SURFACE = pygame_surf
@@ -41,28 +53,108 @@ def get_cairo_ctx(surf):
         width, height, width * 4)
     return cairo.Context(surf)
 
-def draw_line(color, start_pos, end_pos, line_width, surf=None):
-    ctx = get_cairo_ctx(surf or SURFACE)
-    ctx.set_source_rgb(*color)
-    ctx.set_line_width(line_width)
-    ctx.set_line_cap(cairo.LINE_CAP_ROUND)
-    ctx.move_to(*start_pos)
-    ctx.line_to(*end_pos)
-    ctx.stroke()
-    del ctx
+def _queue(surf, kind, color, line_width, shape):
+    surf = surf or SURFACE
+    if _batches:
+        last = _batches[-1]
+        if last[0] is surf and last[1] == kind and last[2] == color \
+                and last[3] == line_width:
+            last[4].append(shape)
+            return
+    _batches.append([surf, kind, color, line_width, [shape]])
 
-def draw_circle(color, pos, radius, line_width=0, surf=None):
-    ctx = get_cairo_ctx(surf or SURFACE)
-    if line_width > 0:
-        ctx.set_line_width(line_width)
+def _queue_many(surf, kind, color, line_width, shapes):
+    surf = surf or SURFACE
+    if _batches:
+        last = _batches[-1]
+        if last[0] is surf and last[1] == kind and last[2] == color \
+                and last[3] == line_width:
+            last[4].extend(shapes)
+            return
+    _batches.append([surf, kind, color, line_width, list(shapes)])
+
+def set_antialias(on):
+    """Smooth the edges of shapes drawn from now on, or not"""
+    global ANTIALIAS
+    ANTIALIAS = on
+
+def begin_frame(surf=None):
+    """
+    Start a new frame on surf (or the screen), dropping anything that
+    was never flushed
+    """
+    if surf is not None:
+        set_screen(surf)
+    del _batches[:]
+
+def queue_line(color, start_pos, end_pos, line_width, surf=None):
+    _queue(surf, LINES, color, line_width, (start_pos, end_pos))
+
+def queue_circle(color, pos, radius, line_width=0, surf=None):
+    _queue(surf, CIRCLES, color, line_width, (pos, radius))
 
-    ctx.set_source_rgb(*color)
-    ctx.arc(pos[0], pos[1], radius, 0, 2 * math.pi)
-    if line_width > 0:
+def queue_lines(color, lines, line_width, surf=None):
+    """Queue many (start_pos, end_pos) lines at once"""
+    _queue_many(surf, LINES, color, line_width, lines)
+
+def queue_circles(color, circles, line_width=0, surf=None):
+    """Queue many (pos, radius) circles at once"""
+    _queue_many(surf, CIRCLES, color, line_width, circles)
+
+def _draw_batch(ctx, kind, color, line_width, shapes):
+    # Colors are PyGame colors, from 0 to 255
+    ctx.set_source_rgb(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
+    if kind == LINES:
+        ctx.set_line_width(line_width)
+        ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+        for start_pos, end_pos in shapes:
+            ctx.move_to(*start_pos)
+            ctx.line_to(*end_pos)
         ctx.stroke()
     else:
-        ctx.fill()
-    del ctx
+        if line_width > 0:
+            ctx.set_line_width(line_width)
+        for pos, radius in shapes:
+            ctx.new_sub_path()
+            ctx.arc(pos[0], pos[1], radius, 0, 2 * math.pi)
+        if line_width > 0:
+            ctx.stroke()
+        else:
+            ctx.fill()
+
+def draw_line(color, start_pos, end_pos, line_width, surf=None):
+    queue_line(color, start_pos, end_pos, line_width, surf)
+    finish_draw(surf)
+
+def draw_circle(color, pos, radius, line_width=0, surf=None):
+    queue_circle(color, pos, radius, line_width, surf)
+    finish_draw(surf)
 
 def finish_draw(surf=None):
-    pass
+    """
+    Draw all queued shapes, wrapping each target surface in a cairo
+    context only once. If surf is given, only shapes queued for that
+    surface are drawn.
+    """
+    if not _batches:
+        return
+    if surf is None:
+        todo = _batches[:]
+        del _batches[:]
+    else:
+        todo = [x for x in _batches if x[0] is surf]
+        _batches[:] = [x for x in _batches if x[0] is not surf]
+    ctxs = {}
+    for target, kind, color, line_width, shapes in todo:
+        ctx = ctxs.get(id(target))
+        if ctx is None:
+            ctx = ctxs[id(target)] = get_cairo_ctx(target)
+            # Keep to the clip area of the surface, as PyGame does
+            clip = target.get_clip()
+            if clip != target.get_rect():
+                ctx.rectangle(*clip)
+                ctx.clip()
+            if not ANTIALIAS:
+                ctx.set_antialias(cairo.ANTIALIAS_NONE)
+        _draw_batch(ctx, kind, color, line_width, shapes)
+    del ctxs
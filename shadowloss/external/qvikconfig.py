@@ -139,6 +139,18 @@ properties, equal signs. While spaces and tabs are just fine, newlines
   {'=': 'not a ,'}
 
 
+Numbers and iterating
+---------------------
+
+Numbers that are not integers are returned as ``decimal.Decimal``
+objects so that no information is lost. Pass ``native_numbers=True``
+to ``parse`` to get floats instead, which is faster.
+
+``iterparse`` takes the same arguments as ``parse`` but yields
+``(property, value)`` tuples one entry at a time instead of building a
+dict.
+
+
 Version information
 -------------------
 
@@ -152,162 +164,189 @@ There is NO WARRANTY, to the extent permitted by law.
 """
 
 
-# Constants
-_config_comment_regex = re.compile(r'#.*')
+# Reading input
+def _read_input(in_file=None, **kwargs):
+    # Try to find out if input is a file or a string. If it's a
+    # file, extract the data.
 
-# The parser class
-class _QvikParser(dict):
-    def __init__(self, in_file=None, **kwargs):
-        # Try to find out if input is a file or a string. If it's a
-        # file, extract the data.
-        
-        def fil2dat(t):
-            # If it's a file..
+    def fil2dat(t):
+        # If it's a file..
+        try:
+            return open(t, 'U').read()
+        except TypeError:
             try:
-                return open(t, 'U').read()
-            except TypeError:
-                try:
-                    return t.read().replace(
-                        '\r\n', '\n').replace('\r', '\n')
-                except Exception:
-                    raise TypeError('argument not file')
-
-        # Testing
-        fil = kwargs.get('file')
-        if not fil:
-            dat = kwargs.get('data')
-            if not dat:
-                if in_file:
-                    fil = in_file
-                    dat = fil2dat(fil)
-                else:
-                    raise TypeError('missing arguments')
+                return t.read().replace(
+                    '\r\n', '\n').replace('\r', '\n')
+            except Exception:
+                raise TypeError('argument not file')
+
+    # Testing
+    fil = kwargs.get('file')
+    if not fil:
+        dat = kwargs.get('data')
+        if not dat:
+            if in_file:
+                fil = in_file
+                dat = fil2dat(fil)
             else:
-                if not isinstance(dat, basestring):
-                    raise TypeError('data must be a string')
+                raise TypeError('missing arguments')
+        else:
+            if not isinstance(dat, basestring):
+                raise TypeError('data must be a string')
+    else:
+        dat = fil2dat(fil)
+    return dat
+
+def _convert(dat, native_numbers=False):
+    # Convert to internal Python data
+    if dat.startswith('"') or dat.startswith("'"):
+        return eval(dat)
+    if dat == 'true':
+        return True
+    if dat == 'false':
+        return False
+    if dat == 'none':
+        return None
+    try:
+        return int(dat)
+    except ValueError:
+        if native_numbers:
+            try:
+                return float(dat)
+            except ValueError:
+                return dat
+        try:
+            return decimal.Decimal(dat)
+        except decimal.InvalidOperation:
+            return dat
+
+def _find_end_quote(text, start, qtype, line):
+    # Find the quote ending the quoted string starting at text[start]
+    offset = start + 1
+    while True:
+        tn = text.find(qtype, offset)
+        if tn == -1:
+            raise SyntaxError('missing end quote \
+in entry beginning on line %d' % line)
+        if tn - 1 > start and text[tn - 1] == '\\' \
+                and text[tn - 2] != '\\':
+            offset = tn + 1
+        else:
+            return tn
+
+def _skip_space(text, i, end):
+    while i < end and text[i].isspace():
+        i += 1
+    return i
+
+def _parse_values(x, i, line, convert):
+    # Parse the comma-separated values in x starting at index i
+    n = len(x)
+    vals = []
+    while True:
+        if i < n and x[i] in '"\'':
+            tn = _find_end_quote(x, i, x[i], line)
+            vals.append(convert(x[i:tn + 1]))
+            i = _skip_space(x, tn + 1, n)
+            if i < n and x[i] == ',':
+                i = _skip_space(x, i + 1, n)
+                continue
+            break
+        # If not with quotes
+        end = x.find(',', i)
+        if end != -1:
+            vals.append(convert(x[i:end].rstrip()))
+            i = _skip_space(x, end + 1, n)
         else:
-            dat = fil2dat(fil)
+            vals.append(convert(x[i:].rstrip()))
+            break
+    if len(vals) == 1:
+        return vals[0]
+    return [v for v in vals if v != '']
+
+def _parse_entry(x, line, convert):
+    # Split one (joined) entry into its property and its values
+    prop = None
+    i = None
+    if x.startswith('"') or x.startswith("'"):
+        tn = _find_end_quote(x, 0, x[0], line)
+        prop = convert(x[:tn + 1])
+        i = _skip_space(x, tn + 1, len(x))
+        if not x.startswith('=', i):
+            raise SyntaxError('no equal sign \
+present in entry beginning on line %d' % line)
+        i = _skip_space(x, i + 1, len(x))
+    if not prop:
+        tn = x.find('=')
+        prop = x[:tn].rstrip()
+        i = _skip_space(x, tn + 1, len(x))
+    return prop, _parse_values(x, i, line, convert)
+
+def _tokenize(data, native_numbers=False):
+    # Yield (property, value) entries from the data in one pass.
+    # Comments are cut off, and lines ending with a single comma or a
+    # backslash are joined with the next lines.
+    convert = lambda dat: _convert(dat, native_numbers)
+    lines = data.split('\n')
+    n = len(lines)
+    i = 0
+    while i < n:
+        start = i
+        x = lines[i]
+        i += 1
+        h = x.find('#')
+        if h != -1:
+            x = x[:h]
+        x = x.strip()
+        if not x:
+            continue
+        comma = x.endswith(',') and not x.endswith(',,')
+        backslash = x.endswith('\\')
+        if comma or backslash:
+            pieces = [x]
+            while comma or backslash:
+                # The data is considered to end with an empty line
+                if i < n:
+                    nxt = lines[i]
+                    h = nxt.find('#')
+                    if h != -1:
+                        nxt = nxt[:h]
+                elif i == n:
+                    nxt = ''
+                else:
+                    raise SyntaxError('unexpected end of data \
+in entry beginning on line %d' % (start + 1))
+                i += 1
+                if comma:
+                    nxt = nxt.strip()
+                else:
+                    # Remove the backslash
+                    pieces[-1] = pieces[-1][:-1]
+                    if not pieces[-1] and len(pieces) > 1:
+                        pieces.pop()
+                if nxt:
+                    pieces.append(nxt)
+                last = pieces[-1]
+                comma = last.endswith(',')
+                backslash = last.endswith('\\')
+            x = ''.join(pieces)
+        yield _parse_entry(x, start + 1, convert)
 
+# The parser class
+class _QvikParser(dict):
+    def __init__(self, in_file=None, **kwargs):
+        self.native_numbers = kwargs.get('native_numbers', False)
         # Save the data in case someone needs it
-        self.rawdata = dat
+        self.rawdata = _read_input(in_file, **kwargs)
         # Parse
         self.parse_data()
 
     def convert(self, dat):
-        # Convert to internal Python data
-        if dat.startswith('"') or dat.startswith("'"):
-            return eval(dat)
-        if dat == 'true':
-            return True
-        if dat == 'false':
-            return False
-        if dat == 'none':
-            return None
-        try:
-            return int(dat)
-        except ValueError:
-            try:
-                return decimal.Decimal(dat)
-            except decimal.InvalidOperation:
-                return dat
+        return _convert(dat, self.native_numbers)
 
     def parse_data(self):
         # Parse the rawdata string
-        data = _config_comment_regex.sub('', self.rawdata).split('\n')
-        data.append('')
-
-        for i in range(len(data) - 1):
-            # All entries have one property and one or more values.
-            x = data[i].strip()
-            if not x: continue
-            t = i
-            comma = x.endswith(',') and not x.endswith(',,')
-            while comma or x.endswith('\\'):
-                t += 1
-                if comma:
-                    x += data[t].strip()
-                else:
-                    x = x[:-1] + data[t]
-                data[t] = ''
-                comma = x.endswith(',')
-
-            prop = None
-            for qtype in ('"', "'"):
-                if x.startswith(qtype):
-                    offset = 1
-                    while True:
-                        tn = x.find(qtype, offset)
-                        try:
-                            new_search_cond = x[tn - 1] == '\\' \
-                                and x[tn - 2] != '\\'
-                        except IndexError:
-                            new_search_cond = False
-                        if tn == -1:
-                            raise SyntaxError('missing end quote \
-in entry beginning on line %d' % (i + 1))
-                        elif new_search_cond:
-                            offset = tn + 1
-                        else:
-                            prop = self.convert(x[:tn + 1])
-                            cval = x[tn + 1:].strip()
-                            if not cval.startswith('='):
-                                raise SyntaxError('no equal sign \
-present in entry beginning on line %d' % (i + 1))
-                            else:
-                                cval = cval[1:].lstrip()
-                            break
-
-            if not prop:
-                tn = x.find('=')
-                prop = x[:tn].rstrip()
-                cval = x[tn + 1:].strip()
-            vals = []
-            done = False
-            while not done:
-                halfdone = False
-                for qtype in ('"', "'"):
-                    if cval.startswith(qtype):
-                        offset = 1
-                        while True:
-                            tn = cval.find(qtype, offset)
-                            try:
-                                new_search_cond = cval[tn - 1] == '\\' \
-                                    and cval[tn - 2] != '\\'
-                            except IndexError:
-                                new_search_cond = False
-                            if tn == -1:
-                                raise SyntaxError('missing end quote \
-in entry beginning on line %d' % (i + 1))
-                            elif new_search_cond:
-                                offset = tn + 1
-                            else:
-                                break
-                        vals.append(self.convert(cval[:tn + 1]))
-                        cval = cval[tn + 1:].lstrip()
-                        if cval.startswith(','):
-                            cval = cval[1:].lstrip()
-                            halfdone = True
-                            break
-                        else:
-                            done = True
-                            break
-                if done: break
-                elif halfdone: continue
-                # If not with quotes
-                end = cval.find(',')
-                if end != -1:
-                    vals.append(self.convert(cval[:end].rstrip()))
-                    cval = cval[end + 1:].lstrip()
-                else:
-                    vals.append(self.convert(cval.rstrip()))
-                    break
-            if len(vals) == 1:
-                vals = vals[0]
-            else:
-                nvals = []
-                for x in vals:
-                    if x != '': nvals.append(x)
-                vals = nvals
+        for prop, vals in _tokenize(self.rawdata, self.native_numbers):
             self.__setitem__(prop, vals)
             
 
@@ -328,6 +367,17 @@ def parse(in_file=None, **kwargs):
     class QvikParser(_QvikParser): pass
     return QvikParser(in_file, **kwargs)
 
+def iterparse(in_file=None, **kwargs):
+    """
+    iterparse([filename|file_object], (file=filename|file_object)|data=string)
+
+    Like parse, but yield (property, value) tuples one at a time
+    instead of returning a dict. Properties given more than once are
+    yielded more than once.
+    """
+    return _tokenize(_read_input(in_file, **kwargs),
+                     kwargs.get('native_numbers', False))
+
 # Dumping (writing)
 #~~~~~~~~~~~~~~~~~~
 # Disallowed characters and patterns in strings not using
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.frametimer
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Measures where the time of a frame goes
+##[ Start date  ]## 2026 October 17
+
+import shadowloss.various as various
+
+class FrameTimer(object):
+    """
+    Keeps the durations of the last frames and of their phases in
+    fixed-size ring buffers. A frame starts with start_frame, and
+    mark(phase) adds the time since the previous mark to that phase.
+    All durations are in milliseconds. tally(name, value) notes a
+    per-frame count, such as the number of objects not drawn.
+    """
+    def __init__(self, size=600, clock=None):
+        self.size = max(1, int(size))
+        self.clock = clock or various.monotonic_time
+        self.frames = [0.0] * self.size
+        self.phases = {}
+        self.order = []
+        self.counters = {}
+        self.counter_order = []
+        self.tallies = {}
+        self.count = 0
+        self.index = 0
+        self.current = {}
+        self.frame_start = None
+        self.last_mark = None
+
+    def start_frame(self):
+        """End the current frame (if any) and start a new one"""
+        now = self.clock()
+        if self.frame_start is not None:
+            self._store(now)
+        self.frame_start = self.last_mark = now
+        self.current.clear()
+        self.tallies.clear()
+
+    def mark(self, phase):
+        now = self.clock()
+        if phase not in self.phases:
+            self.phases[phase] = [0.0] * self.size
+            self.order.append(phase)
+        self.current[phase] = self.current.get(phase, 0.0) + \
+            (now - self.last_mark) * 1000.0
+        self.last_mark = now
+
+    def tally(self, name, value):
+        if name not in self.counters:
+            self.counters[name] = [0] * self.size
+            self.counter_order.append(name)
+        self.tallies[name] = self.tallies.get(name, 0) + value
+
+    def _store(self, now):
+        i = self.index
+        self.frames[i] = (now - self.frame_start) * 1000.0
+        for phase, ring in self.phases.iteritems():
+            ring[i] = self.current.get(phase, 0.0)
+        for name, ring in self.counters.iteritems():
+            ring[i] = self.tallies.get(name, 0)
+        self.index = (i + 1) % self.size
+        self.count += 1
+
+    def samples(self, ring):
+        """Get the stored samples of a ring buffer, oldest first"""
+        if self.count < self.size:
+            return ring[:self.count]
+        return ring[self.index:] + ring[:self.index]
+
+    def stats(self):
+        """
+        Get (name, p50, p95, p99) of the whole frame and of every
+        phase, in the order the phases were first seen
+        """
+        return self._stats([('frame', self.frames)] +
+                           [(x, self.phases[x]) for x in self.order])
+
+    def counter_stats(self):
+        """Get (name, p50, p95, p99) of every tallied count"""
+        return self._stats([(x, self.counters[x])
+                            for x in self.counter_order])
+
+    def _stats(self, rings):
+        stats = []
+        for name, ring in rings:
+            values = sorted(self.samples(ring))
+            stats.append((name,) + tuple(percentile(values, p)
+                                         for p in (50, 95, 99)))
+        return stats
+
+    def report(self):
+        lines = ['%d frames, times in ms:' % min(self.count, self.size),
+                 '%-12s %8s %8s %8s' % ('', 'p50', 'p95', 'p99')]
+        for x in self.stats():
+            lines.append('%-12s %8.2f %8.2f %8.2f' % x)
+        counts = self.counter_stats()
+        if counts:
+            lines.append('counts per frame:')
+            for x in counts:
+                lines.append('%-12s %8d %8d %8d' % x)
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Write the report and all stored samples to a file"""
+        names = ['frame'] + self.order + self.counter_order
+        columns = [self.samples(self.frames)] + \
+            [self.samples(self.phases[x]) for x in self.order] + \
+            [self.samples(self.counters[x]) for x in self.counter_order]
+        f = open(path, 'w')
+        try:
+            for line in self.report().split('\n'):
+                f.write('# %s\n' % line)
+            f.write(','.join(names) + '\n')
+            for row in zip(*columns):
+                f.write(','.join('%.4f' % x for x in row) + '\n')
+        finally:
+            f.close()
+
+def percentile(values, p):
+    """Get the p'th percentile of sorted values (nearest rank)"""
+    if not values:
+        return 0.0
+    i = int(len(values) * p / 100.0 + 0.5) - 1
+    return values[min(len(values) - 1, max(0, i))]
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.ghosts
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Poses and records ghost runners
+##[ Start date  ]## 2026 October 17
+
+# Ghosts are stickfigures replaying earlier runs of a level. There can
+# be many of them, so their bodies are generated all at once: the limbs
+# of a stickfigure are compiled into a list of operations which are then
+# evaluated with NumPy for every (step, speed) pair in one go. The
+# result is the same as that of StickFigure.build_body. Without NumPy,
+# the bodies are generated one at a time.
+
+import weakref
+from array import array
+from shadowloss.stickfigure import LINE, CIRCLE, LinearChange
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class _Info(object):
+    pass
+
+class BatchedFigure(object):
+    """The limbs of a stickfigure, ready to be posed many times at once"""
+    def __init__(self, figure):
+        if numpy is None:
+            raise ImportError('NumPy is needed for batched stickfigures')
+        self.figure = figure
+        # Every point gets a new slot each time it is (re)placed, so
+        # lines drawn from an old position of it keep that position.
+        self.slots = 0
+        self.names = {}
+        self.lines = []
+        self.circles = []
+        self.objects = []
+        for x in figure.objects:
+            if x[0] == LINE:
+                start, end = x[1], x[2]
+                flip = False
+                if start is None and end is None:
+                    figure.parent.error('line not linked to anything, ignoring')
+                    continue
+                elif start is None:
+                    flip = True
+                    start, end = end, None
+                elif start not in self.names and end in self.names:
+                    flip = True
+                    start, end = end, start
+                if start not in self.names:
+                    self.names[start] = self._new_slot()
+                line = (self.names[start], self._new_slot(), x[3], x[4],
+                        flip, x[5])
+                if end is not None:
+                    self.names[end] = line[1]
+                self.objects.append((LINE, len(self.lines)))
+                self.lines.append(line)
+            elif x[0] == CIRCLE:
+                if x[1] is None:
+                    figure.parent.error('circle not linked to anything, ignoring')
+                    continue
+                self.objects.append((CIRCLE, len(self.circles)))
+                self.circles.append((self.names[x[1]], x[2]))
+
+    def _new_slot(self):
+        self.slots += 1
+        return self.slots - 1
+
+    def generate(self, steps, speeds):
+        """Pose the stickfigure at every (step, speed) pair"""
+        steps = numpy.asarray(steps, dtype=float) % 1000
+        speeds = numpy.asarray(speeds, dtype=float)
+        n = len(steps)
+        info = _Info()
+        info.step = steps
+        info.speed = speeds
+
+        xs = [None] * self.slots
+        ys = [None] * self.slots
+        zero = numpy.zeros(n)
+        line_points = []
+        for start, end, angle, length, flip, visible in self.lines:
+            angle = _evaluate(angle, info, steps, speeds)
+            length = _evaluate(length, info, steps, speeds)
+            if flip:
+                angle = (angle + 180) % 360
+            angle = numpy.radians(angle)
+            if xs[start] is None:
+                xs[start] = ys[start] = zero
+            xs[end] = xs[start] + length * numpy.cos(angle)
+            ys[end] = ys[start] + length * numpy.sin(angle)
+            line_points.append((start, end))
+        radii = []
+        for slot, radius in self.circles:
+            radii.append(_evaluate_radius(radius, steps))
+
+        used = sorted(set([x for pair in line_points for x in pair] +
+                          [x[0] for x in self.circles]))
+        # One row per slot, one column per pose
+        all_xs = numpy.array([xs[i] for i in used])
+        all_ys = numpy.array([ys[i] for i in used])
+        offset_x = _evaluate(self.figure.get_offset_x, info, steps, speeds)
+        offset_y = _evaluate(self.figure.get_offset_y, info, steps, speeds)
+        all_xs = all_xs - all_xs.min(axis=0) + offset_x
+        all_ys = all_ys - all_ys.min(axis=0) + offset_y
+        rows = dict((slot, i) for i, slot in enumerate(used))
+        return Bodies(self, all_xs, all_ys, rows, line_points, radii,
+                      (all_xs.max(axis=0) - all_xs.min(axis=0),
+                       all_ys.max(axis=0) - all_ys.min(axis=0)))
+
+class Bodies(object):
+    """Many poses of one stickfigure"""
+    def __init__(self, batch, xs, ys, rows, line_points, radii, size):
+        self.batch = batch
+        self.xs = xs
+        self.ys = ys
+        self.rows = rows
+        self.line_points = line_points
+        self.radii = radii
+        self.size = size
+
+    def __len__(self):
+        return self.xs.shape[1]
+
+    def body(self, i):
+        """Get pose i as (objects, points, size) like build_body does"""
+        point = lambda slot: [float(self.xs[self.rows[slot], i]),
+                              float(self.ys[self.rows[slot], i])]
+        objs = []
+        for kind, j in self.batch.objects:
+            if kind == LINE:
+                start, end = self.line_points[j]
+                objs.append((LINE, point(start), point(end),
+                             self.batch.lines[j][5]))
+            else:
+                objs.append((CIRCLE, point(self.batch.circles[j][0]),
+                             float(self.radii[j][i])))
+        points = dict((name, point(slot)) for name, slot
+                      in self.batch.names.iteritems())
+        return objs, points, (float(self.size[0][i]),
+                              float(self.size[1][i]))
+
+    def shapes(self, shifts, zoom, virtual_size, offset):
+        """
+        Get the visible lines and the circles of all poses in screen
+        coordinates, each pose centered like World.center_point does
+        and moved shifts[i] virtual units to the right
+        """
+        left = ((virtual_size[0] - self.size[0]) / 2 +
+                numpy.asarray(shifts, dtype=float))
+        xs = (left + self.xs) * zoom + offset[0]
+        ys = (virtual_size[1] - self.ys) * zoom + offset[1]
+        lines = []
+        for (start, end), line in zip(self.line_points, self.batch.lines):
+            if line[5]:
+                a, b = self.rows[start], self.rows[end]
+                lines.extend(zip(zip(xs[a].tolist(), ys[a].tolist()),
+                                 zip(xs[b].tolist(), ys[b].tolist())))
+        circles = []
+        for (slot, radius_func), radii in zip(self.batch.circles, self.radii):
+            i = self.rows[slot]
+            circles.extend(zip(zip(xs[i].tolist(), ys[i].tolist()),
+                               (radii * zoom).tolist()))
+        return lines, circles
+
+class PoseList(object):
+    """Many poses of one stickfigure, generated one at a time"""
+    def __init__(self, figure, steps, speeds):
+        self.poses = [figure.generate_body(step, speed)
+                      for step, speed in zip(steps, speeds)]
+
+    def __len__(self):
+        return len(self.poses)
+
+    def body(self, i):
+        return self.poses[i]
+
+    def shapes(self, shifts, zoom, virtual_size, offset):
+        lines = []
+        circles = []
+        for (objs, points, size), shift in zip(self.poses, shifts):
+            left = (virtual_size[0] - size[0]) / 2 + shift
+            point = lambda p: ((left + p[0]) * zoom + offset[0],
+                               (virtual_size[1] - p[1]) * zoom + offset[1])
+            for x in objs:
+                if x[0] == LINE and x[3]:
+                    lines.append((point(x[1]), point(x[2])))
+                elif x[0] == CIRCLE:
+                    circles.append((point(x[1]), x[2] * zoom))
+        return lines, circles
+
+_batches = weakref.WeakKeyDictionary()
+
+def pose_many(figure, steps, speeds):
+    """
+    Pose a stickfigure at every (step, speed) pair, using NumPy if it
+    is available
+    """
+    if numpy is None:
+        return PoseList(figure, steps, speeds)
+    batch = _batches.get(figure)
+    if batch is None:
+        batch = _batches[figure] = BatchedFigure(figure)
+    return batch.generate(steps, speeds)
+
+def verify(figure, steps, speeds):
+    """
+    Get the largest difference between the batched poses and those of
+    build_body (0.0 if they are the same)
+    """
+    bodies = BatchedFigure(figure).generate(steps, speeds)
+    worst = 0.0
+    for i, (step, speed) in enumerate(zip(steps, speeds)):
+        objs, points, size = figure.build_body(step, speed)
+        b_objs, b_points, b_size = bodies.body(i)
+        if len(objs) != len(b_objs) or sorted(points) != sorted(b_points):
+            return float('inf')
+        numbers = []
+        for x, y in zip(objs, b_objs):
+            if x[0] != y[0]:
+                return float('inf')
+            numbers.extend(zip(x[1], y[1]))
+            if x[0] == LINE:
+                numbers.extend(zip(x[2], y[2]))
+            else:
+                numbers.append((x[2], y[2]))
+        for key in points:
+            numbers.extend(zip(points[key], b_points[key]))
+        numbers.extend(zip(size, b_size))
+        for x, y in numbers:
+            worst = max(worst, abs(x - y))
+    return worst
+
+def _row_infos(steps, speeds):
+    for step, speed in zip(steps.tolist(), speeds.tolist()):
+        info = _Info()
+        info.step = step
+        info.speed = speed
+        yield info
+
+def _evaluate(func, info, steps, speeds):
+    # LinearChange is evaluated as a whole. Other functions are first
+    # tried on all poses at once, and called once per pose if they do
+    # not work with arrays.
+    if isinstance(func, LinearChange):
+        if func.measure == 'speed':
+            return _linear_change(func, speeds)
+        return _linear_change(func, steps)
+    try:
+        value = numpy.asarray(func(info), dtype=float)
+        if value.shape == ():
+            return numpy.repeat(value, len(steps))
+        if value.shape == steps.shape:
+            return value
+    except Exception:
+        pass
+    return numpy.array([func(x) for x in _row_infos(steps, speeds)],
+                       dtype=float)
+
+def _evaluate_radius(func, steps):
+    # Circles are given the step instead of the whole info
+    try:
+        value = numpy.asarray(func(steps), dtype=float)
+        if value.shape == ():
+            return numpy.repeat(value, len(steps))
+        if value.shape == steps.shape:
+            return value
+    except Exception:
+        pass
+    return numpy.array([func(x) for x in steps.tolist()], dtype=float)
+
+def _linear_change(change, measures):
+    # The same as LinearChange.__call__, for an array of measures
+    result = numpy.zeros(len(measures))
+    todo = numpy.ones(len(measures), dtype=bool)
+    for x in change.intervals:
+        a = min(x[:2])
+        b = max(x[:2])
+        if a != x[0]:
+            d, c = x[2], x[3]
+        else:
+            c, d = x[2], x[3]
+        if a == -1:
+            hit = todo & (b <= measures)
+            result[hit] = x[2]
+        elif a >= 0 and b != a:
+            hit = todo & (measures < b)
+            if a > 0:
+                hit &= measures >= a
+            result[hit] = ((measures[hit] - a) / float(b - a)) * \
+                (d - c) + c
+        else:
+            continue
+        todo &= ~hit
+    return result
+
+class GhostRun(object):
+    """The position, animation step and speed after every update of a run"""
+    def __init__(self):
+        self.positions = array('d')
+        self.steps = array('d')
+        self.speeds = array('d')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, pos, step, speed):
+        self.positions.append(pos)
+        self.steps.append(step)
+        self.speeds.append(speed)
+
+    def sample(self, i, alpha=1.0):
+        """
+        Get (pos, step, speed) a fraction alpha of the way from update
+        i - 1 to update i. The run stands still after its last update.
+        """
+        last = len(self.positions) - 1
+        b = max(0, min(i, last))
+        a = max(0, min(i - 1, last))
+        pos = self.positions[a] + (self.positions[b] -
+                                   self.positions[a]) * alpha
+        step_diff = self.steps[b] - self.steps[a]
+        if step_diff < 0:
+            step_diff += 1000
+        return pos, (self.steps[a] + step_diff * alpha) % 1000, \
+            self.speeds[b]
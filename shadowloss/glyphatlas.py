@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.glyphatlas
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Renders text from cached glyphs
+##[ Start date  ]## 2026 October 17
+
+import threading
+import pygame
+from pygame.locals import *
+
+class GlyphAtlas(object):
+    """
+    Renders text by putting together glyphs which have each been
+    rendered only once for every font size and color.
+    """
+    def __init__(self, font_path, reference_size=250):
+        self.font_path = font_path
+        self.fonts = {}
+        self.glyphs = {}
+        # The height of a rendered line relative to the font size
+        self.height_ratio = self.get_font(reference_size).get_height() \
+            / float(reference_size)
+        self.glyph_renders = 0
+        self.strings = 0
+        self.renders_saved = 0
+        # Levels may be loaded in other threads
+        self.lock = threading.RLock()
+
+    def get_font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pygame.font.Font(self.font_path, size)
+        return font
+
+    def font_size(self, height):
+        """Get the font size whose lines are the given height"""
+        return max(1, int(round(height / self.height_ratio)))
+
+    def get_glyph(self, char, size, color):
+        key = char, size, color
+        glyph = self.glyphs.get(key)
+        if glyph is None:
+            glyph = self.glyphs[key] = \
+                self.get_font(size).render(char, True, color)
+            self.glyph_renders += 1
+        return glyph
+
+    def text_size(self, text, height):
+        self.lock.acquire()
+        try:
+            font = self.get_font(self.font_size(height))
+            return max(1, font.size(text)[0]), max(1, int(height))
+        finally:
+            self.lock.release()
+
+    def render(self, text, height, color=(255, 255, 255)):
+        """Render text so that it is the given height in pixels"""
+        self.lock.acquire()
+        try:
+            return self._render(text, height, color)
+        finally:
+            self.lock.release()
+
+    def _render(self, text, height, color):
+        size = self.font_size(height)
+        font = self.get_font(size)
+        renders = self.glyph_renders
+        surf = pygame.Surface(self.text_size(text, height), SRCALPHA, 32)
+        for i, char in enumerate(text):
+            # Place every glyph where the font would put it when
+            # rendering the whole text, so that kerning is kept.
+            x = font.size(text[:i])[0] if i else 0
+            surf.blit(self.get_glyph(char, size, color), (x, 0),
+                      special_flags=BLEND_RGBA_MAX)
+        self.strings += 1
+        if self.glyph_renders == renders:
+            self.renders_saved += 1
+        return surf
+
+    def stats(self):
+        return 'glyphs: %d, strings: %d, font renders saved: %d' % (
+            self.glyph_renders, self.strings, self.renders_saved)
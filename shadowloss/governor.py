@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.governor
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Lowers the drawing quality when frames are too slow
+##[ Start date  ]## 2026 October 17
+
+from shadowloss.frametimer import percentile
+
+# Each tier draws more cheaply than the one before it, and also does
+# what the tiers before it do.
+FULL = 0
+NO_ANTIALIASING = 1
+LOW_RESOLUTION = 2
+COARSE_ANIMATION = 3
+TIER_NAMES = ('full', 'no antialiasing', 'low resolution',
+              'coarse animation')
+
+# Frames are timed against this rate when it is not limited
+DEFAULT_TARGET_FPS = 60
+
+# How many milliseconds of animation each stickfigure pose is shown for
+# in the coarse animation tier
+COARSE_ANIMATION_STEP = 25
+
+def parse_tier(value):
+    """
+    Get a tier from a number or a name, or None if it is None or
+    'auto'. Raises ValueError if there is no such tier.
+    """
+    if value is None or value == 'auto':
+        return None
+    if value in TIER_NAMES:
+        return TIER_NAMES.index(value)
+    tier = int(value)
+    if not FULL <= tier <= COARSE_ANIMATION:
+        raise ValueError('no quality tier %d' % tier)
+    return tier
+
+class QualityGovernor(object):
+    """
+    Picks a quality tier from how long frames take. The median frame
+    time of every window of frames is compared to the budget: the tier
+    goes down when it is over, and up again only when it is well under
+    for hold windows in a row. A step up that has to be undone right
+    away makes the next one wait twice as long.
+    """
+    def __init__(self, budget, window=30, down=1.0, up=0.6, hold=2,
+                 max_hold=32):
+        self.budget = budget
+        self.window = window
+        self.down = down * budget
+        self.up = up * budget
+        self.min_hold = self.hold = hold
+        self.max_hold = max_hold
+        self.tier = FULL
+        self.times = []
+        self.good_windows = 0
+        self.stepped_up = False
+        self.changes = 0
+
+    def add(self, frame_time):
+        """
+        Note how many milliseconds a frame took, not counting waiting
+        for the frame rate limit. Returns the new tier if it changed,
+        and None otherwise.
+        """
+        self.times.append(frame_time)
+        if len(self.times) < self.window:
+            return None
+        self.times.sort()
+        median = percentile(self.times, 50)
+        del self.times[:]
+        stepped_up = self.stepped_up
+        self.stepped_up = False
+        if median > self.down:
+            self.good_windows = 0
+            if stepped_up:
+                self.hold = min(self.max_hold, self.hold * 2)
+            if self.tier == COARSE_ANIMATION:
+                return None
+            self.tier += 1
+        elif median < self.up and self.tier > FULL:
+            self.good_windows += 1
+            if self.good_windows < self.hold:
+                return None
+            self.good_windows = 0
+            self.stepped_up = True
+            self.tier -= 1
+        else:
+            self.good_windows = 0
+            if not stepped_up:
+                self.hold = max(self.min_hold, self.hold / 2)
+            return None
+        self.changes += 1
+        return self.tier
+
+    def report(self):
+        return 'quality tier: %d (%s), %d changes, budget %.1f ms' % (
+            self.tier, TIER_NAMES[self.tier], self.changes, self.budget)
@@ -24,145 +24,249 @@
 ##[ Description ]## Controls levels
 ##[ Start date  ]## 2010 September 13
 
-import datetime
 import re
+import decimal
+import threading
+from collections import namedtuple
 import shadowloss.various as various
+from shadowloss.objectindex import ObjectIndex
+from shadowloss.objectstore import ObjectStore
+from shadowloss.scheduler import Scheduler
+from shadowloss.ghosts import GhostRun
 from shadowloss.builtinstickfigures import stickfigures as builtinstickfigures
 try:
-    from qvikconfig import parse as config_parse
+    from qvikconfig import iterparse as config_iterparse
 except ImportError:
-    from shadowloss.external.qvikconfig import parse as config_parse
+    from shadowloss.external.qvikconfig import iterparse as config_iterparse
 
 PLAYING = 1
 WON = 2
 LOST = 3
 
-class ObjectContainer(various.Container):
-    def get_current_part(self):
-        """Get current part of this object"""
-        return self.parts[self.current_part]
-
-    def has_pos(self, test_pos):
-        """Check if a position is inside this object"""
-        part = self.get_current_part()
-        return self.pos - part.width / 2 <= test_pos <= self.pos + part.width / 2
-
-class PartContainer(various.Container):
-    pass
+# Levels are updated this many times per second by default
+DEFAULT_SIM_RATE = 60
+
+GHOST_COLOR = (96, 96, 96)
+
+# Input kinds
+KEY = 'key'
+LASER = 'laser'
+
+# Events of the level's scheduler: (PART_CHANGE, object index, object)
+# and (TEMP_SPEED_END,)
+PART_CHANGE = 1
+TEMP_SPEED_END = 2
+
+# Everything about a level that changes while it is played. letters
+# and numbers are the saved ObjectIndexes, whose first item tells which
+# objects are left; base_letters and base_numbers the saved
+# ObjectStores.
+LevelState = namedtuple('LevelState', (
+        'speed', 'pos', 'time', 'temp_speed_still',
+        'current_temp_speed_increase', 'current_temp_speed_duration',
+        'current_temp_speed_time', 'orig_time', 'prev_time', 'prev_pos',
+        'prev_anim_time', 'next_obj', 'body_color', 'status', 'updates',
+        'letters', 'numbers', 'base_letters', 'base_numbers',
+        'scheduler'))
+
+def split_inputs(inputs, now):
+    """
+    Split (time, kind, value) inputs into those due at now, sorted by
+    time, and the rest
+    """
+    due = sorted((x for x in inputs if x[0] <= now), key=lambda x: x[0])
+    return due, [x for x in inputs if x[0] > now]
+
+def extract_text_settings(sets):
+    """
+    Extracts settings from text settings in the shadowloss
+    syntax
+    """
+    info = {}
+    sets = [x.split('=') for x in sets.rstrip(')]').split(';')]
+    for x in sets:
+        info[x[0]] = float(x[1])
+
+    return info
+
+def parse_objects(lst):
+    """
+    Split a list of letters or numbers in shadowloss syntax into
+    (position, [(string, local settings), ...], global settings)
+    tuples.
+    """
+    objects = []
+    if lst is None:
+        return objects
+    elif isinstance(lst, basestring):
+        lst = [lst]
+    for x in lst:
+        # Split the entry into its parts and its global settings
+        contents = x.split('[')
+        if len(contents) > 1:
+            global_settings = extract_text_settings(contents[1])
+        else:
+            global_settings = {}
+
+        # Parse the parts
+        subcontents = contents[0].split(':')
+        parts = []
+        for y in subcontents[1:]:
+            contents = y.split('(')
+            if len(contents) > 1:
+                local_settings = extract_text_settings(contents[1])
+            else:
+                local_settings = {}
+            parts.append((contents[0], local_settings))
+
+        objects.append((float(subcontents[0]), parts, global_settings))
+
+    return objects
+
+def read_level_data(path):
+    """
+    Parse a level file. Returns a dict of its settings in which
+    'letters' and 'numbers' have been split with parse_objects.
+    """
+    data = {}
+    for key, val in config_iterparse(path, native_numbers=True):
+        data[key] = plain_value(val)
+    for key in ('letters', 'numbers'):
+        data[key] = parse_objects(data.get(key))
+    return data
+
+def plain_value(val):
+    """Convert parsed config values to built-in types"""
+    if isinstance(val, list):
+        return [plain_value(x) for x in val]
+    if isinstance(val, decimal.Decimal):
+        return float(val)
+    return val
+
+class LevelHandle(object):
+    """
+    A level which is not loaded until it is needed. It can be loaded
+    in the background and unloaded again.
+    """
+    def __init__(self, parent, path):
+        self.parent = parent
+        self.path = path
+        self.level = None
+        self.lock = threading.Lock()
 
-class SettingsContainer(various.Container):
-    pass
+    def is_loaded(self):
+        return self.level is not None
 
-class Level(object):
-    def _extract_text_settings(self, sets):
+    def get(self):
         """
-        Extracts settings from text settings in the shadowloss
-        syntax
+        Get the level, loading it if necessary. If it is being loaded
+        in the background, wait for that to finish. Only call this from
+        the main thread: it renders the text of the level if that has
+        not been done at the current zoom.
         """
-        info = {}
-        sets = [x.split('=') for x in sets.rstrip(')]').split(';')]
-        for x in sets:
-            info[x[0]] = float(x[1])
-
-        return info
+        level = self._load(True)
+        if level.text_zoom != self.parent.disp_zoom:
+            level.render_text()
+        return level
+
+    def _load(self, text):
+        self.lock.acquire()
+        try:
+            if self.level is None:
+                self.level = Level(self.parent, self.path, text)
+            return self.level
+        finally:
+            self.lock.release()
+
+    def prefetch(self):
+        """Start loading the level in the background"""
+        if self.level is None:
+            various.thread(self._prefetch)
+
+    def _prefetch(self):
+        # SDL surfaces are only created on the main thread, so the
+        # text is rendered when the level is first got. Measuring text
+        # here is safe, as pygame.font is only used under the lock of
+        # the glyph atlas.
+        try:
+            self._load(False)
+        except Exception, e:
+            # It will be tried again, and fail visibly, if the level
+            # is ever used
+            self.parent.error('could not load level %s: %s'
+                              % (repr(self.path), e))
+
+    def evict(self):
+        """Unload the level, freeing its surfaces"""
+        self.lock.acquire()
+        try:
+            if self.level is not None:
+                self.parent.debug_print('level %s unloaded'
+                                        % repr(self.path))
+            self.level = None
+        finally:
+            self.lock.release()
 
+class Level(object):
     def create_objects(self, lst, typ=None):
         """
-        Create usable objects from a list of letters or numbers in
-        shadowloss syntax.
+        Create an ObjectStore of letters or numbers split with
+        parse_objects.
         """
-        objects = []
-
         obj_height = typ == 'letter' and self.letter_height \
-                or self.number_height
-
-        if lst is None:
-            return objects
-        elif isinstance(lst, basestring):
-            lst = [lst]
-        for x in lst:
-            # Split the entry into its parts and its global settings
-            contents = x.split('[')
-            if len(contents) > 1:
-                global_settings = self._extract_text_settings(contents[1])
-            else:
-                global_settings = {}
+            or self.number_height
+        objects = ObjectStore(typ, obj_height)
 
-            # Parse the parts
-            subcontents = contents[0].split(':')
+        for pos, part_list, global_settings in sorted(lst or [],
+                                                      key=lambda x: x[0]):
             parts = []
-            for y in subcontents[1:]:
-                contents = y.split('(')
-                if len(contents) > 1:
-                    local_settings = self._extract_text_settings(contents[1])
-                else:
-                    local_settings = {}
-
+            for string, local_settings in part_list:
                 # Use a hierarchy for settings:
                 # Local settings OR global settings OR default settings
                 t_get = lambda name, default: \
                     local_settings.get(name) or \
                     global_settings.get(name) or default
 
-                settings = SettingsContainer()
-                settings.duration = int(
+                duration = int(
                     t_get('dur', typ == 'letter' and
                           self.defaults.letter_duration
                           or self.defaults.number_duration) * 1000)
 
-                settings.destruction_duration = int(
+                destruction_duration = int(
                     t_get('ddur', typ == 'letter' and
                           self.defaults.letter_destruction_duration
                           or self.defaults.number_destruction_duration) * 1000)
 
                 if typ == 'letter':
-                    settings.speed_decrease = t_get(
+                    speed_change = t_get(
                         'dec', self.defaults.speed_decrease)
-                elif typ == 'number':
-                    settings.speed_increase = t_get(
+                else:
+                    speed_change = t_get(
                         'inc', self.defaults.temp_speed_increase)
 
-                string = contents[0]
-                surf = self.parent.create_text(string, obj_height)
+                # The size is in virtual units (not depending on the
+                # zoom)
+                width, height = self.parent.text_size(string, obj_height)
 
-                # Save the information
-                info = PartContainer()
-                info.string = string
-                if typ == 'letter':
-                    info.letter = string
-                    info.temp_text = ''
-                elif typ == 'number':
-                    info.number = float(string)
-                info.settings = settings
-                info.surface = surf
-                info.width = surf.get_size()[0]
-                info.height = surf.get_size()[1]
-
-                parts.append(info)
-
-            # Basic info
-            pos = float(subcontents[0])
-
-            info = ObjectContainer()
-            info.type = typ
-            info.pos = pos
-            info.parts = parts
-            info.current_part = 0
-            info.current_time = None
-            info.time_shooting = None
-            info.font_height = obj_height
-            info.avg_height = sum([p.height for p in parts]) / len(parts)
-            info.avg_width = sum([p.width for p in parts]) / len(parts)
-            
-            objects.append(info)
+                # The text is rendered by render_text
+                parts.append((string, width, height, None, duration,
+                              destruction_duration, speed_change))
+
+            objects.add(pos, parts)
 
         return objects
 
-    def __init__(self, parent, path):
+    def __init__(self, parent, path, text=True):
+        """
+        Load a level. Unless text is true, the text of its objects is
+        not rendered until render_text is called.
+        """
         self.parent = parent
         self.path = path
+        # The zoom the text was rendered at, if it has been
+        self.text_zoom = None
 
-        data = config_parse(path)
+        data = self.parent.read_level(path)
 
         # Starting speed of stickfigure
         self.start_speed = float(data.get('start speed') or 1.0)
@@ -189,6 +293,10 @@ class Level(object):
         # Stickfigure to be used
         self.stickfigure = builtinstickfigures[
             data.get('stickfigure') or 'zorna'].create(self.parent)
+        if self.parent.use_pose_cache:
+            self.stickfigure.enable_pose_cache(
+                float(self.parent.pose_speed_resolution),
+                int(self.parent.pose_cache_size))
 
         # Font heights
         font_height = data.get('font height')
@@ -232,14 +340,31 @@ class Level(object):
         self.base_letters = self.create_objects(data.get('letters'), 'letter')
         self.base_numbers = self.create_objects(data.get('numbers'), 'number')
 
+        # Earlier runs, shown as ghosts
+        self.ghosts = []
+
+        self.scheduler = Scheduler()
+
         self.parent.debug_print('level %s created' % repr(self.path))
         
-        # Prepare
-        self.start()
+        # Prepare. The level might be loaded in the background, so it
+        # must not touch the screen yet.
+        self.reset()
+        if text:
+            self.render_text()
 
-    def start(self):
+    def start(self, now=None):
         """(Re)start the level"""
-        now = datetime.datetime.now()
+        self.reset(now)
+        self.parent.fill_borders(self.body_color)
+        self.color_foreground()
+
+        self.parent.debug_print('level %s started' % repr(self.path))
+
+    def reset(self, now=None):
+        """Reset the state of the level without drawing anything"""
+        if now is None:
+            now = self.parent.get_time()
 
         self.speed = self.start_speed
         self.pos = self.start_pos
@@ -251,58 +376,145 @@ class Level(object):
 
         self.orig_time = now
         self.prev_time = now
+        self.prev_pos = self.pos
+        self.prev_anim_time = self.time
+        self.next_obj = None
+        # The number of objects not drawn in the last frame
+        self.culled = 0
 
         # Reset certain values
-        for x in (self.base_letters, self.base_numbers):
-            for y in x:
-                y.current_time = now
-                y.time_shooting = 0
-                for z in y.parts:
-                    if y.type == 'letter':
-                        z.temp_text = ''
-        self.letters, self.numbers = self.base_letters[:], self.base_numbers[:]
+        self.base_letters.reset(now)
+        self.base_numbers.reset(now)
+        self.letters = ObjectIndex(self.base_letters)
+        self.numbers = ObjectIndex(self.base_numbers)
+
+        # Objects with more than one part change part when their
+        # current part has been shown long enough
+        self.scheduler.clear()
+        self.scheduler.add_many((x.store.deadline(i), (PART_CHANGE, x, i))
+                                for x in (self.letters, self.numbers)
+                                for i in x.store.multipart)
 
         self.body_color = (255, 255, 255)
-        self.parent.fill_borders(self.body_color)
-        self.color_foreground()
+        self.status = PLAYING
 
-        self.parent.debug_print('level %s started' % repr(self.path))
+        # The number of updates since the start, and the run so far if
+        # it is to be shown as a ghost later
+        self.updates = 0
+        if self.parent.max_ghosts:
+            self.ghost_run = GhostRun()
+        else:
+            self.ghost_run = None
 
-        self.status = PLAYING
+    def save_state(self):
+        """
+        Get everything that changes while playing as a LevelState, for
+        restore_state
+        """
+        return LevelState(
+            self.speed, self.pos, self.time, self.temp_speed_still,
+            self.current_temp_speed_increase,
+            self.current_temp_speed_duration,
+            self.current_temp_speed_time, self.orig_time,
+            self.prev_time, self.prev_pos, self.prev_anim_time,
+            self.next_obj, self.body_color, self.status, self.updates,
+            self.letters.save(), self.numbers.save(),
+            self.base_letters.save(), self.base_numbers.save(),
+            self.scheduler.save())
+
+    def restore_state(self, state):
+        """Go back to a state from save_state (without drawing anything)"""
+        (self.speed, self.pos, self.time, self.temp_speed_still,
+         self.current_temp_speed_increase,
+         self.current_temp_speed_duration,
+         self.current_temp_speed_time, self.orig_time,
+         self.prev_time, self.prev_pos, self.prev_anim_time,
+         self.next_obj, self.body_color, self.status, self.updates,
+         letters, numbers, base_letters, base_numbers, scheduler) = state
+        self.letters.restore(letters)
+        self.numbers.restore(numbers)
+        self.base_letters.restore(base_letters)
+        self.base_numbers.restore(base_numbers)
+        self.scheduler.restore(scheduler)
 
     def color_foreground(self):
         """Colors all elements in one color (self.body_color)"""
         self.parent.fill_borders(self.body_color)
-        for x in (self.letters, self.numbers):
-            for y in x:
-                for z in y.parts:
-                    z.surface = self.parent.create_text(z.string, y.font_height, self.body_color)
+        self.parent.clear_sprite_cache()
+        # Removed objects are colored too, which is faster than
+        # leaving them out
+        self.render_text()
+
+    def render_text(self):
+        """Render the text of all objects at the current zoom"""
+        self.text_zoom = getattr(self.parent, 'disp_zoom', None)
+        for x in (self.base_letters, self.base_numbers):
+            x.render_text(self.parent.create_text, self.body_color)
 
     def switch_hook(self):
-        self.parent.fill_borders(self.body_color)        
+        if self.status == PLAYING:
+            # The level has not been played yet, but its clock is
+            # still at the time it was created.
+            self.reset()
+        self.parent.fill_borders(self.body_color)
 
     def lose(self):
         self.status = LOST
         self.body_color = (255, 0, 0)
         self.color_foreground()
         self.parent.shooting = False
+        self.parent.play_sound('lose')
         self.parent.debug_print('level %s lost' % repr(self.path))
 
     def win(self):
         self.status = WON
         self.body_color = (0, 255, 0)
         self.color_foreground()
+        self.parent.play_sound('win')
         self.parent.debug_print('level %s won' % repr(self.path))
 
-    def update(self, letters=[]):
-        """Update the level"""
+    def update(self, letters=[], now=None, inputs=()):
+        """
+        Update the level. now is the time in milliseconds, by default
+        the time given by the parent. letters are typed at now.
+
+        inputs are (time, kind, value) tuples sorted by time and no
+        later than now, where kind is KEY (value is the letter) or
+        LASER (value is True or False). The level is advanced to the
+        time of each input before it is applied.
+        """
+        # Remember the previous state for draw() to interpolate from
+        self.prev_pos = self.pos
+        self.prev_anim_time = self.time
         if self.status != PLAYING:
             # You have either won or lost.
             return
-
+        if now is None:
+            now = self.parent.get_time()
+
+        for time, kind, value in inputs:
+            if time > self.prev_time:
+                self.advance(time)
+                if self.status != PLAYING:
+                    break
+            if kind == KEY:
+                self.judge_letters([value])
+            elif kind == LASER:
+                self.parent.shooting = value
+        else:
+            self.advance(now, letters)
+
+        self.updates += 1
+        if self.ghost_run is not None:
+            self.ghost_run.add(self.pos, self.time, self.speed)
+            if self.status != PLAYING:
+                self.add_ghost(self.ghost_run)
+                self.ghost_run = None
+
+    def advance(self, now, letters=()):
+        """Move the level on to the time now, typing letters there"""
         # Time
-        now = datetime.datetime.now()
-        time_increase = (now - self.prev_time).microseconds / 1000.0
+        time_increase = now - self.prev_time
         self.time += time_increase * self.speed
         self.prev_time = now
         if self.time > 999:
@@ -312,83 +524,74 @@ class Level(object):
         self.speed += self.speed_increase_per_second * time_increase / 1000.0
         self.pos += self.speed * (time_increase / 10.0)
 
-        # Check for end of any current continous penalty speed increase
-        if self.current_temp_speed_time is not None:
-            if (now - self.current_temp_speed_time).microseconds \
-                    / 1000.0 > self.current_temp_speed_duration:
-                self.speed -= self.current_temp_speed_increase
-                self.current_temp_speed_increase = 0
-                self.current_temp_speed_duration = 0
-                self.current_temp_speed_time = None
+        # Check for end of any current continous penalty speed
+        # increase. Part changes are done last.
+        part_changes = []
+        for deadline, event in self.scheduler.due(now):
+            if event[0] == PART_CHANGE:
+                part_changes.append((deadline, event))
+            elif self.current_temp_speed_time is not None and \
+                    deadline == self.temp_speed_deadline():
+                if now - self.current_temp_speed_time \
+                        > self.current_temp_speed_duration:
+                    self.speed -= self.current_temp_speed_increase
+                    self.current_temp_speed_increase = 0
+                    self.current_temp_speed_duration = 0
+                    self.current_temp_speed_time = None
+                else:
+                    self.scheduler.add(deadline, event)
 
         # Letter detection
-        ok = False
-        for x in self.letters:
-            part = x.get_current_part()
-            if x.has_pos(self.pos):
-                test = part.letter.lower()
-                for y in letters:
-                    if test.startswith(part.temp_text + y):
-                        part.temp_text += y
-                        if part.temp_text == test:
-                            part.temp_text = ''
-                            self.letters.remove(x)
-                            self.speed -= part.settings.speed_decrease
-                    else:
-                        self.speed += self.speed_increase
-                        part.temp_text = ''
-                ok = True
-                break
-
-        # Speed increases when pressing keys in empty areas
-        if not ok:
-            for x in letters:
-                self.speed += self.speed_increase
+        self.judge_letters(letters)
 
         # Number detection
-        for x in self.numbers:
+        for x in self.numbers.covering(self.pos):
             part = x.get_current_part()
-            if x.has_pos(self.pos):
-                self.numbers.remove(x)
-                self.current_temp_speed_time = now
-                self.current_temp_speed_duration += part.number * 1000
-                this_speed_increase = part.settings.speed_increase
-                self.current_temp_speed_increase += this_speed_increase
-                self.speed += this_speed_increase
+            self.numbers.remove(x)
+            self.current_temp_speed_time = now
+            self.current_temp_speed_duration += part.number * 1000
+            this_speed_increase = part.settings.speed_increase
+            self.current_temp_speed_increase += this_speed_increase
+            self.speed += this_speed_increase
+            self.scheduler.add(self.temp_speed_deadline(), (TEMP_SPEED_END,))
+            self.parent.play_sound('number')
 
         # Check for shots
         if self.parent.shooting:
             try:
                 self.next_obj.time_shooting += time_increase
                 part = self.next_obj.get_current_part()
+                # The object may have been run into in this very step
                 if self.next_obj.time_shooting > \
                         part.settings.destruction_duration:
-                    if self.next_obj.type == 'letter':
+                    if self.next_obj in self.letters:
                         self.letters.remove(self.next_obj)
-                    elif self.next_obj.type == 'number':
+                    elif self.next_obj in self.numbers:
                         self.numbers.remove(self.next_obj)
             except AttributeError:
                 pass
 
         # Find the next object
-        next_obj_pos = [float('inf'), float('inf')]
-        self.next_obj = None
-        # See if objects with more than one part needs changing into
-        # the next parts
-        for x in (self.letters, self.numbers):
-            for y in x:
-                if self.pos < y.pos and y.pos < next_obj_pos:
-                    next_obj_pos = y.pos
-                    self.next_obj = y
-                if len(y.parts) == 1:
-                    continue
-                part = y.get_current_part()
-                current_duration = (now - y.current_time).microseconds / 1000.0
-                if current_duration >= part.settings.duration:
-                    y.current_time = now
-                    y.current_part = (y.current_part + 1) % len(y.parts)
-                    if y.type == 'letter':
-                        part.temp_text = ''
+        next_letter = self.letters.next_after(self.pos)
+        next_number = self.numbers.next_after(self.pos)
+        if next_number is None or (next_letter is not None and
+                                   next_letter.pos <= next_number.pos):
+            self.next_obj = next_letter
+        else:
+            self.next_obj = next_number
+
+        # Change the objects that are due into their next parts.
+        # Removed objects are dropped from the scheduler here.
+        for deadline, event in part_changes:
+            index, i = event[1:]
+            if not index.alive[i]:
+                continue
+            store = index.store
+            if store.is_due(i, now):
+                store.next_part(i, now)
+                self.scheduler.add(store.deadline(i), event)
+            else:
+                self.scheduler.add(deadline, event)
 
         # Win if you have reached the given stop speed
         if self.speed <= self.stop_speed:
@@ -397,16 +600,80 @@ class Level(object):
         elif self.pos >= self.length:
             self.lose()
 
-    def draw(self):
-        # Draw objects
+    def judge_letters(self, letters):
+        """Type letters where the level is now"""
+        x = self.letters.first_covering(self.pos)
+        if x is not None:
+            part = x.get_current_part()
+            test = part.letter.lower()
+            for y in letters:
+                if test.startswith(part.temp_text + y):
+                    part.temp_text += y
+                    if part.temp_text == test:
+                        part.temp_text = ''
+                        self.letters.remove(x)
+                        self.speed -= part.settings.speed_decrease
+                    self.parent.play_sound('letter')
+                else:
+                    self.speed += self.speed_increase
+                    part.temp_text = ''
+                    self.parent.play_sound('wrong')
+        else:
+            # Speed increases when pressing keys in empty areas
+            for x in letters:
+                self.speed += self.speed_increase
+                self.parent.play_sound('wrong')
+
+    def temp_speed_deadline(self):
+        """Get when the current temporary speed increase ends"""
+        return self.current_temp_speed_time + \
+            self.current_temp_speed_duration
+
+    def add_ghost(self, run):
+        """Show a finished run as a ghost in the next runs"""
+        self.ghosts.append(run)
+        del self.ghosts[:-int(self.parent.max_ghosts)]
+
+    def interpolate(self, alpha):
+        """
+        Get the position and the animation time a fraction alpha of
+        the way from the previous update to the current one
+        """
+        pos = self.prev_pos + (self.pos - self.prev_pos) * alpha
+        anim_diff = self.time - self.prev_anim_time
+        if anim_diff < 0:
+            anim_diff += 1000
+        return pos, (self.prev_anim_time + anim_diff * alpha) % 1000
+
+    def draw_ghosts(self, pos, alpha=1.0):
+        # The ghosts are where their runs were after as many updates
+        samples = [x.sample(self.updates - 1, alpha) for x in self.ghosts]
+        self.parent.draw_ghosts(self.stickfigure,
+                                [x[0] - pos for x in samples],
+                                [x[1] for x in samples],
+                                [x[2] for x in samples], GHOST_COLOR)
+
+    def draw(self, alpha=1.0):
+        pos, anim_time = self.interpolate(alpha)
+
+        # Draw the objects on the screen
+        half = self.parent.virtual_size[0] / 2
+        drawn = 0
         for x in (self.letters, self.numbers):
-            for y in x:
+            for y in x.overlapping(pos - half, pos + half):
                 self.parent.blit(y.get_current_part().surface,
-                                 (y.pos - self.pos +
-                                  self.parent.virtual_size[0] / 2, 0))
+                                 (y.pos - pos + half, 0))
+                drawn += 1
+        self.culled = len(self.letters) + len(self.numbers) - drawn
+        self.parent.mark_phase('objects')
+
+        # Draw earlier runs behind the stickfigure
+        if self.ghosts:
+            self.draw_ghosts(pos, alpha)
+
         # Draw stickfigure
-        objs, points, size = self.stickfigure.draw(
-            self.time, self.speed, self.body_color)
+        objs, points, size = self.parent.draw_stickfigure(
+            self.stickfigure, anim_time, self.speed, self.body_color)
 
         eye_pos = self.parent.draw_stickfigure_circle(
             points['eye'], 3, size, (0, 0, 255))
@@ -416,14 +683,16 @@ class Level(object):
                 [self.next_obj.pos, self.next_obj.avg_height / 2], 25
             * (self.next_obj.time_shooting /
                self.next_obj.get_current_part().settings.destruction_duration),
-                self.pos, (255, 0, 255), None, True)
+                pos, (255, 0, 255))
             
             if self.parent.shooting:
                 self.parent.draw_line(eye_pos, shot_pos, 6,
                                       (0, 0, 255), True)
-        
-        # Draw start and end wall
-        self.parent.draw_wall(-float('inf'), self.parent.virtual_size[0] / 2 -
-                               self.pos, self.body_color)
-        self.parent.draw_wall(self.length - self.pos + self.parent.virtual_size[0] /
-                              2, float('inf'), self.body_color)
+        self.parent.mark_phase('stickfigure')
+
+        # Draw start and end wall, if they are on the screen
+        if pos < half:
+            self.parent.draw_wall(-float('inf'), half - pos, self.body_color)
+        if self.length - pos + half < self.parent.virtual_size[0]:
+            self.parent.draw_wall(self.length - pos + half, float('inf'),
+                                  self.body_color)
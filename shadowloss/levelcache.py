@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.levelcache
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Stores parsed levels so that they load faster
+##[ Start date  ]## 2026 October 17
+
+import os
+import sys
+import marshal
+import hashlib
+from shadowloss.level import read_level_data
+
+# Increase this whenever the format of parsed levels changes
+CACHE_VERSION = 2
+MAGIC = 'SHLC'
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'shadowloss', 'levels')
+
+class LevelCache(object):
+    """
+    Keeps parsed levels in marshalled files in a cache directory. A
+    cached level is only used if the path, size and modification time
+    of its level file are the same as when it was cached.
+    """
+    def __init__(self, directory=None, rebuild=False):
+        self.directory = directory or default_cache_dir()
+        self.rebuild = rebuild
+        # Paths whose cache files have been rewritten since rebuild
+        self.rebuilt = set()
+        self.hits = 0
+        self.misses = 0
+        # marshal's format depends on the Python version
+        self.version = (CACHE_VERSION, marshal.version,
+                        tuple(sys.version_info[:2]))
+
+    def cache_path(self, path):
+        return os.path.join(self.directory,
+                            hashlib.sha1(path).hexdigest() + '.slc')
+
+    def read(self, path):
+        """Get the parsed data of a level file"""
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        stamp = (path, info.st_size, info.st_mtime)
+        cache_path = self.cache_path(path)
+        if not self.rebuild or path in self.rebuilt:
+            data = self._load(cache_path, stamp)
+            if data is not None:
+                self.hits += 1
+                return data
+        self.misses += 1
+        data = read_level_data(path)
+        if self._store(cache_path, stamp, data) and self.rebuild:
+            self.rebuilt.add(path)
+        return data
+
+    def _load(self, cache_path, stamp):
+        try:
+            f = open(cache_path, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return None
+                version, cached_stamp, data = marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                return None
+        finally:
+            f.close()
+        if version != self.version or tuple(cached_stamp) != stamp:
+            return None
+        return data
+
+    def _store(self, cache_path, stamp, data):
+        """Write a cache file. Returns whether it could be written."""
+        # Write to a temporary file first so that a crash never leaves
+        # a broken cache file behind
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            f = open(tmp_path, 'wb')
+            try:
+                f.write(MAGIC)
+                marshal.dump((self.version, stamp, data), f)
+            finally:
+                f.close()
+            os.rename(tmp_path, cache_path)
+            return True
+        except (IOError, OSError, ValueError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def report(self):
+        return 'level cache: %d hits, %d misses' % (self.hits, self.misses)
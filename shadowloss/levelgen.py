@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.levelgen
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Generates levels of any size
+##[ Start date  ]## 2026 October 17
+
+# Levels are written while they are generated, so their size is only
+# limited by the disk. Letters and numbers are listed separately in a
+# level file, so the objects are generated twice from the same seed:
+# once writing the letters and once writing the numbers.
+
+import os
+import sys
+import json
+import random
+import string
+import tempfile
+import subprocess
+
+LETTERS = string.ascii_uppercase
+
+class LevelGenerator(object):
+    """
+    Generates a level with the given number of objects, placed about
+    spacing apart (or spread over length, if given). Of the objects,
+    number_ratio are numbers, multipart_ratio have more than one part,
+    and settings_ratio have settings of their own.
+    """
+    def __init__(self, objects, seed=None, spacing=40.0, length=None,
+                 number_ratio=0.2, multipart_ratio=0.3, settings_ratio=0.3,
+                 start_speed=1.0, stop_speed=0.2,
+                 speed_increase_per_second=0.05, stickfigure='zorna'):
+        self.objects = int(objects)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.margin = 200.0
+        if length is not None:
+            self.spacing = max(1e-3, (float(length) - 2 * self.margin)
+                               / max(1, self.objects))
+            self.length = float(length)
+        else:
+            self.spacing = float(spacing)
+            self.length = 2 * self.margin + self.spacing * self.objects
+        self.number_ratio = number_ratio
+        self.multipart_ratio = multipart_ratio
+        self.settings_ratio = settings_ratio
+        self.start_speed = start_speed
+        self.stop_speed = stop_speed
+        self.speed_increase_per_second = speed_increase_per_second
+        self.stickfigure = stickfigure
+
+    def entries(self):
+        """Generate (type, entry text) of every object, in order"""
+        rand = random.Random(self.seed)
+        for i in xrange(self.objects):
+            pos = self.margin + (i + rand.uniform(0.25, 0.75)) * self.spacing
+            if rand.random() < self.number_ratio:
+                typ = 'number'
+            else:
+                typ = 'letter'
+            n_parts = 1
+            if rand.random() < self.multipart_ratio:
+                n_parts = rand.randint(2, 4)
+            parts = []
+            for j in range(n_parts):
+                if typ == 'letter':
+                    part = ''.join(rand.choice(LETTERS) for k
+                                   in range(rand.randint(1, 3)))
+                else:
+                    part = str(rand.randint(1, 9))
+                if rand.random() < self.settings_ratio:
+                    part += '(dur=%.2f)' % rand.uniform(0.3, 2.0)
+                parts.append(part)
+            entry = '%.2f:%s' % (pos, ':'.join(parts))
+            if rand.random() < self.settings_ratio:
+                if typ == 'letter':
+                    entry += '[dec=%.2f]' % rand.uniform(0.05, 0.5)
+                else:
+                    entry += '[inc=%.2f]' % rand.uniform(0.1, 1.0)
+            yield typ, entry
+
+    def write(self, out):
+        """Write the level to a file object"""
+        out.write('# Generated by shadowloss.levelgen with seed %d\n\n'
+                  % self.seed)
+        out.write('length = %.2f\n' % self.length)
+        out.write('stickfigure = %s\n' % self.stickfigure)
+        out.write('start speed = %s\n' % self.start_speed)
+        out.write('stop speed = %s\n' % self.stop_speed)
+        out.write('speed increase per second = %s\n'
+                  % self.speed_increase_per_second)
+        for name, typ in (('letters', 'letter'), ('numbers', 'number')):
+            first = True
+            for entry_type, entry in self.entries():
+                if entry_type != typ:
+                    continue
+                if first:
+                    out.write('\n%s = \\\n    %s' % (name, entry))
+                    first = False
+                else:
+                    out.write(', \\\n    %s' % entry)
+            if not first:
+                out.write('\n')
+
+    def save(self, path):
+        f = open(path, 'w')
+        try:
+            self.write(f)
+        finally:
+            f.close()
+
+def _peak_memory():
+    # In KiB on Linux
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(path, data_dir=None, frames=120, draw=True):
+    """
+    Measure how a level behaves: the time it takes to parse it and to
+    load it, the memory the loaded level takes, and the time of an
+    update and of a frame. Run it in a fresh process for the memory
+    number to mean anything.
+    """
+    import shadowloss.various as various
+    from shadowloss.level import read_level_data, Level, PLAYING, \
+        DEFAULT_SIM_RATE
+    from shadowloss.simulation import HeadlessParent, \
+        ApproximateFontMetrics
+    info = {'path': path, 'bytes': os.path.getsize(path)}
+
+    start = various.monotonic_time()
+    read_level_data(path)
+    info['parse'] = various.monotonic_time() - start
+
+    before = _peak_memory()
+    parent = HeadlessParent(ApproximateFontMetrics())
+    start = various.monotonic_time()
+    level = Level(parent, path)
+    info['load'] = various.monotonic_time() - start
+    info['memory'] = (_peak_memory() - before) * 1024
+    info['objects'] = len(level.base_letters) + len(level.base_numbers)
+
+    step = 1000.0 / DEFAULT_SIM_RATE
+    level.start(0.0)
+    start = various.monotonic_time()
+    t = 0.0
+    for i in range(frames):
+        if level.status != PLAYING:
+            level.start(t)
+        t += step
+        parent.time = t
+        level.update([], t)
+    info['update'] = (various.monotonic_time() - start) / frames
+    del level, parent
+
+    if draw:
+        try:
+            info['frame'] = _measure_frames(path, data_dir, frames)
+        except ImportError, e:
+            info['frame error'] = str(e)
+    return info
+
+def _measure_frames(path, data_dir, frames):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import shadowloss.various as various
+    from shadowloss.world import World
+    from shadowloss.level import PLAYING
+    world = World(data_dir=data_dir, levels=[path], mute=True,
+                  term_verbose=False, use_level_cache=False)
+    world.setup()
+    level = world.current_level
+    step = 1000.0 / float(world.sim_rate)
+    start = various.monotonic_time()
+    for i in range(frames):
+        if level.status != PLAYING:
+            level.start()
+        world.sim_time += step
+        level.update([], world.sim_time)
+        world.draw()
+    return (various.monotonic_time() - start) / frames
+
+def scaling(counts, data_dir=None, seed=0, max_draw_objects=100000,
+            out=sys.stdout, **options):
+    """
+    Generate levels with every number of objects in counts and measure
+    them, each in its own process
+    """
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix='shadowloss-scaling-')
+    try:
+        for count in counts:
+            path = os.path.join(tmp_dir, 'level-%d.shl' % count)
+            LevelGenerator(count, seed, **options).save(path)
+            args = [sys.executable, '-m', 'shadowloss.levelgen',
+                    '--measure', path]
+            if data_dir:
+                args += ['--data-dir', data_dir]
+            if count > max_draw_objects:
+                args.append('--no-draw')
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join(
+                [os.path.dirname(os.path.dirname(
+                            os.path.abspath(__file__)))] +
+                [x for x in [env.get('PYTHONPATH')] if x])
+            output = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                      env=env).communicate()[0]
+            try:
+                info = json.loads(output.strip().splitlines()[-1])
+            except (ValueError, IndexError):
+                info = {'objects': count, 'error': 'measuring failed'}
+            results.append(info)
+            out.write(format_row(info) + '\n')
+            out.flush()
+    finally:
+        for x in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, x))
+        os.rmdir(tmp_dir)
+    return results
+
+def format_header():
+    return '%10s %10s %10s %10s %10s %12s %10s' % (
+        'objects', 'MiB file', 'parse ms', 'load ms', 'MiB mem',
+        'update ms', 'frame ms')
+
+def format_row(info):
+    if 'error' in info:
+        return '%10d %s' % (info['objects'], info['error'])
+    frame = info.get('frame')
+    return '%10d %10.2f %10.1f %10.1f %10.1f %12.3f %10s' % (
+        info['objects'], info['bytes'] / 1048576.0, info['parse'] * 1000,
+        info['load'] * 1000, info['memory'] / 1048576.0,
+        info['update'] * 1000,
+        '%.3f' % (frame * 1000) if frame is not None else '-')
+
+def plot(results, path):
+    """Plot the scaling results with matplotlib"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    results = [x for x in results if 'error' not in x]
+    counts = [x['objects'] for x in results]
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4))
+    series = (
+        ('time (ms)', [('parse', 'parse', 1000), ('load', 'load', 1000)]),
+        ('memory (MiB)', [('memory', 'loaded level', 1.0 / 1048576)]),
+        ('time per frame (ms)', [('update', 'update', 1000),
+                                 ('frame', 'update + draw', 1000)]))
+    for ax, (label, lines) in zip(axes, series):
+        for key, name, scale in lines:
+            points = [(x['objects'], x[key] * scale) for x in results
+                      if x.get(key) is not None]
+            if points:
+                ax.plot([p[0] for p in points], [p[1] for p in points],
+                        marker='o', label=name)
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('objects')
+        ax.set_ylabel(label)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+def main(args=None):
+    from optparse import OptionParser, SUPPRESS_HELP
+    import shadowloss.generalinformation as ginfo
+    parser = OptionParser(
+        prog=ginfo.program_name + '-levelgen',
+        usage='Usage: %prog [OPTION]... OUTPUT\n   or: %prog --scaling \
+[OPTION]...',
+        description='Generate a level with random letters and numbers, or \
+measure how the game scales with the number of objects.')
+    parser.add_option('-n', '--objects', dest='objects', type='int',
+                      default=100, metavar='NUMBER',
+                      help='the number of objects (default 100)')
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      metavar='NUMBER', help='the random seed')
+    parser.add_option('--spacing', dest='spacing', type='float',
+                      default=40.0, metavar='DISTANCE',
+                      help='the average distance between objects')
+    parser.add_option('--length', dest='length', type='float',
+                      metavar='DISTANCE',
+                      help='the length of the level (overrides --spacing)')
+    parser.add_option('--numbers', dest='number_ratio', type='float',
+                      default=0.2, metavar='FRACTION',
+                      help='how many of the objects are numbers')
+    parser.add_option('--multipart', dest='multipart_ratio', type='float',
+                      default=0.3, metavar='FRACTION',
+                      help='how many of the objects have several parts')
+    parser.add_option('--settings', dest='settings_ratio', type='float',
+                      default=0.3, metavar='FRACTION',
+                      help='how many of the objects and parts have their \
+own settings')
+    parser.add_option('--scaling', dest='scaling', action='store_true',
+                      help='measure load time, memory and frame time for \
+levels of different sizes')
+    parser.add_option('--counts', dest='counts',
+                      default='10,100,1000,10000,100000', metavar='LIST',
+                      help='the numbers of objects to measure (comma \
+separated)')
+    parser.add_option('--plot', dest='plot', metavar='PATH',
+                      help='plot the measurements to PATH (needs \
+matplotlib)')
+    parser.add_option('--json', dest='json', metavar='PATH',
+                      help='save the measurements as JSON')
+    parser.add_option('-d', '--data-dir', dest='data_dir', metavar='PATH',
+                      default=ginfo.global_data_dir,
+                      help='where the game data is')
+    parser.add_option('--measure', dest='measure', metavar='PATH',
+                      help=SUPPRESS_HELP)
+    parser.add_option('--no-draw', dest='draw', action='store_false',
+                      default=True, help=SUPPRESS_HELP)
+    options, args = parser.parse_args(args)
+
+    if options.measure:
+        print json.dumps(measure(options.measure, options.data_dir,
+                                 draw=options.draw))
+        return 0
+
+    generator_options = dict(
+        spacing=options.spacing, number_ratio=options.number_ratio,
+        multipart_ratio=options.multipart_ratio,
+        settings_ratio=options.settings_ratio)
+    if options.scaling:
+        try:
+            counts = [int(x) for x in options.counts.split(',')]
+        except ValueError:
+            parser.error('--counts must be numbers separated by commas')
+        print format_header()
+        results = scaling(counts, options.data_dir,
+                          options.seed or 0, **generator_options)
+        if options.json:
+            f = open(options.json, 'w')
+            try:
+                json.dump(results, f, indent=2)
+            finally:
+                f.close()
+        if options.plot:
+            try:
+                plot(results, options.plot)
+            except ImportError:
+                print 'matplotlib is not available, not plotting'
+        return 0
+
+    if len(args) != 1:
+        parser.error('give one output file (or - for standard output)')
+    generator = LevelGenerator(options.objects, options.seed,
+                               length=options.length, **generator_options)
+    if args[0] == '-':
+        generator.write(sys.stdout)
+    else:
+        generator.save(args[0])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
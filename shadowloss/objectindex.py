@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.objectindex
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Finds level objects by their position
+##[ Start date  ]## 2026 October 17
+
+from bisect import bisect_left, bisect_right
+
+class ObjectIndex(object):
+    """
+    The objects of an ObjectStore which have not been removed. Removed
+    objects are only marked as such, and a cursor follows the
+    stickfigure so that looking up the objects near it rarely has to
+    search.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.positions = store.pos
+        self.alive = bytearray('\x01') * len(store)
+        self.count = len(store)
+        # How far from its position an object can reach
+        if len(store.width):
+            self.reach = max(store.width) / 2
+        else:
+            self.reach = 0
+        self.cursor = 0
+        self.cursor_pos = -float('inf')
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        alive = self.alive
+        view = self.store.view
+        for i in xrange(len(alive)):
+            if alive[i]:
+                yield view(i)
+
+    def __contains__(self, obj):
+        return obj.store is self.store and bool(self.alive[obj.index])
+
+    def remove(self, obj):
+        i = obj.index
+        if obj.store is not self.store or not self.alive[i]:
+            raise ValueError('object not in index')
+        self.alive[i] = 0
+        self.count -= 1
+
+    def save(self):
+        """Get which objects are removed, for restore"""
+        return self.alive[:], self.count
+
+    def restore(self, state):
+        alive, self.count = state
+        self.alive[:] = alive
+        # Removed objects may be back, so the next seek has to search
+        self.cursor_pos = float('inf')
+
+    def seek(self, pos):
+        """
+        Move the cursor to the first object which might cover pos or
+        come after it, and return its index
+        """
+        if pos < self.cursor_pos:
+            # Moving backwards is rare, so just start over
+            self.cursor = bisect_left(self.positions, pos - self.reach)
+        i = self.cursor
+        n = len(self.alive)
+        positions = self.positions
+        alive = self.alive
+        while i < n and (not alive[i] or positions[i] + self.reach < pos):
+            i += 1
+        self.cursor = i
+        self.cursor_pos = pos
+        return i
+
+    def _covers(self, i, pos):
+        store = self.store
+        half = store.width[store.first_part[i] + store.current_part[i]] / 2
+        return self.positions[i] - half <= pos <= self.positions[i] + half
+
+    def covering(self, pos):
+        """Get all objects covering pos"""
+        found = []
+        i = self.seek(pos)
+        n = len(self.alive)
+        limit = pos + self.reach
+        while i < n and self.positions[i] <= limit:
+            if self.alive[i] and self._covers(i, pos):
+                found.append(self.store.view(i))
+            i += 1
+        return found
+
+    def first_covering(self, pos):
+        """Get the first object covering pos, or None"""
+        i = self.seek(pos)
+        n = len(self.alive)
+        limit = pos + self.reach
+        while i < n and self.positions[i] <= limit:
+            if self.alive[i] and self._covers(i, pos):
+                return self.store.view(i)
+            i += 1
+        return None
+
+    def overlapping(self, left, right):
+        """Get the objects which reach into the range from left to right"""
+        found = []
+        i = bisect_left(self.positions, left - self.reach)
+        n = len(self.alive)
+        limit = right + self.reach
+        positions = self.positions
+        alive = self.alive
+        store = self.store
+        width = store.width
+        first_part = store.first_part
+        current_part = store.current_part
+        while i < n and positions[i] <= limit:
+            if alive[i]:
+                half = width[first_part[i] + current_part[i]] / 2
+                if positions[i] + half >= left and \
+                        positions[i] - half <= right:
+                    found.append(store.view(i))
+            i += 1
+        return found
+
+    def next_after(self, pos):
+        """Get the first object positioned after pos, or None"""
+        i = self.seek(pos)
+        n = len(self.alive)
+        if i < n and self.positions[i] <= pos:
+            i = bisect_right(self.positions, pos, i)
+        while i < n:
+            if self.alive[i]:
+                return self.store.view(i)
+            i += 1
+        return None
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.objectstore
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Stores the letters or numbers of a level in columns
+##[ Start date  ]## 2026 October 17
+
+# A level can have a very large number of objects, so instead of one
+# Python object per object and per part, their values are kept in one
+# array per value. Objects are sorted by position, and object i has the
+# parts first_part[i] to first_part[i] + part_count[i] - 1. Code that
+# wants to work with single objects can get views of them which look
+# like the old containers; there is only one view per object, so views
+# can be compared with "is".
+
+from array import array
+
+class ObjectStore(object):
+    """The letters or the numbers of a level"""
+    def __init__(self, type, font_height):
+        self.type = type
+        self.font_height = font_height
+        # Objects
+        self.pos = array('d')
+        self.first_part = array('l')
+        self.part_count = array('l')
+        self.current_part = array('l')
+        self.current_time = array('d')
+        self.time_shooting = array('d')
+        # Parts
+        self.string = []
+        # Sizes are whole virtual units
+        self.width = array('l')
+        self.height = array('l')
+        self.duration = array('d')
+        self.destruction_duration = array('d')
+        # The speed decrease of a letter or the speed increase of a
+        # number
+        self.speed_change = array('d')
+        self.surface = []
+        if type == 'letter':
+            self.temp_text = []
+        else:
+            self.temp_text = None
+        # The objects with more than one part
+        self.multipart = array('l')
+        self.views = []
+
+    def add(self, pos, parts):
+        """
+        Add an object. Objects must be added in order of position.
+        parts is a list of (string, width, height, surface, duration,
+        destruction duration, speed change) tuples.
+        """
+        i = len(self.pos)
+        self.pos.append(pos)
+        self.first_part.append(len(self.string))
+        self.part_count.append(len(parts))
+        self.current_part.append(0)
+        self.current_time.append(0.0)
+        self.time_shooting.append(0.0)
+        for (string, width, height, surface, duration,
+             destruction_duration, speed_change) in parts:
+            self.string.append(intern(string))
+            self.width.append(width)
+            self.height.append(height)
+            self.surface.append(surface)
+            self.duration.append(duration)
+            self.destruction_duration.append(destruction_duration)
+            self.speed_change.append(speed_change)
+            if self.temp_text is not None:
+                self.temp_text.append('')
+        if len(parts) > 1:
+            self.multipart.append(i)
+        self.views.append(None)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __iter__(self):
+        for i in xrange(len(self.pos)):
+            yield self.view(i)
+
+    def view(self, i):
+        view = self.views[i]
+        if view is None:
+            view = self.views[i] = ObjectView(self, i)
+        return view
+
+    def part_index(self, i):
+        """Get the index of the current part of object i"""
+        return self.first_part[i] + self.current_part[i]
+
+    def reset(self, now):
+        """Reset the timers of all objects"""
+        n = len(self.pos)
+        self.current_time[:] = array('d', [now]) * n
+        self.time_shooting[:] = array('d', [0.0]) * n
+        if self.temp_text is not None:
+            self.temp_text[:] = [''] * len(self.temp_text)
+
+    def render_text(self, create_text, color):
+        """
+        Render the parts of all objects with create_text(string,
+        height, color)
+        """
+        # Most parts share their text with many others
+        rendered = dict((x, create_text(x, self.font_height, color))
+                        for x in set(self.string))
+        self.surface[:] = [rendered[x] for x in self.string]
+
+    def deadline(self, i):
+        """Get when object i changes into its next part"""
+        return self.current_time[i] + \
+            self.duration[self.first_part[i] + self.current_part[i]]
+
+    def is_due(self, i, now):
+        """Check if object i should change into its next part at now"""
+        return now - self.current_time[i] >= \
+            self.duration[self.first_part[i] + self.current_part[i]]
+
+    def next_part(self, i, now):
+        """Change object i into its next part"""
+        part = self.first_part[i] + self.current_part[i]
+        self.current_time[i] = now
+        self.current_part[i] = (self.current_part[i] + 1) % \
+            self.part_count[i]
+        if self.temp_text is not None:
+            self.temp_text[part] = ''
+
+    def save(self):
+        """Get the state of the objects, for restore"""
+        return (self.current_part[:], self.current_time[:],
+                self.time_shooting[:],
+                self.temp_text and self.temp_text[:])
+
+    def restore(self, state):
+        current_part, current_time, time_shooting, temp_text = state
+        self.current_part[:] = current_part
+        self.current_time[:] = current_time
+        self.time_shooting[:] = time_shooting
+        if temp_text:
+            self.temp_text[:] = temp_text
+
+def _column(name):
+    def get(self):
+        return getattr(self.store, name)[self.index]
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(get, set)
+
+class ObjectView(object):
+    """An object in an ObjectStore"""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    pos = _column('pos')
+    current_part = _column('current_part')
+    current_time = _column('current_time')
+    time_shooting = _column('time_shooting')
+
+    @property
+    def type(self):
+        return self.store.type
+
+    @property
+    def font_height(self):
+        return self.store.font_height
+
+    @property
+    def parts(self):
+        store = self.store
+        first = store.first_part[self.index]
+        return [PartView(store, first + j)
+                for j in xrange(store.part_count[self.index])]
+
+    @property
+    def avg_width(self):
+        parts = self.parts
+        return sum(x.width for x in parts) / len(parts)
+
+    @property
+    def avg_height(self):
+        parts = self.parts
+        return sum(x.height for x in parts) / len(parts)
+
+    def get_current_part(self):
+        """Get current part of this object"""
+        return PartView(self.store, self.store.part_index(self.index))
+
+    def has_pos(self, test_pos):
+        """Check if a position is inside this object"""
+        store = self.store
+        half = store.width[store.part_index(self.index)] / 2
+        pos = store.pos[self.index]
+        return pos - half <= test_pos <= pos + half
+
+class PartView(object):
+    """A part of an object in an ObjectStore"""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    string = _column('string')
+    width = _column('width')
+    height = _column('height')
+    surface = _column('surface')
+    temp_text = _column('temp_text')
+
+    @property
+    def letter(self):
+        return self.string
+
+    @property
+    def number(self):
+        return float(self.string)
+
+    @property
+    def settings(self):
+        return SettingsView(self.store, self.index)
+
+class SettingsView(object):
+    """The settings of a part of an object in an ObjectStore"""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    duration = _column('duration')
+    destruction_duration = _column('destruction_duration')
+    speed_decrease = _column('speed_change')
+    speed_increase = _column('speed_change')
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.recording
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Records and replays played sessions
+##[ Start date  ]## 2026 October 17
+
+# A recording is a text file. The first line is
+#
+#   shadowloss-recording <format version> <sim rate>
+#
+# and every other line is an event, "<sim time in ms> <kind> [args]":
+#
+#   level <status> <path>   the level at path became the current one
+#   key <letter>            a letter was typed (escaped)
+#   laser 1|0               the laser was turned on or off
+#   restart                 the current level was restarted
+#   state <status> <speed> <pos>
+#                           the state of the current level, to check
+#   end                     the recording stopped
+#
+# Keys and laser switches happen at their time, in the update that
+# reaches it. Other events happen after the update at their time and
+# before the next one. Recordings ending in .gz are compressed.
+
+import os
+import sys
+import gzip
+import shadowloss.various as various
+from shadowloss.level import Level, PLAYING, KEY, LASER, split_inputs
+from shadowloss.simulation import HeadlessParent, STATUS_NAMES, \
+    default_font_metrics
+
+FORMAT_VERSION = 2
+HEADER = 'shadowloss-recording'
+
+STATUS_VALUES = dict((name, status) for status, name
+                     in STATUS_NAMES.iteritems())
+
+def _open(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return open(path, mode)
+
+def resolve_level_path(path, data_dir=None):
+    """
+    Find a recorded level, looking in the levels directory of data_dir
+    if it is not where it was when it was recorded
+    """
+    if os.path.exists(path) or data_dir is None:
+        return path
+    other = os.path.join(data_dir, 'levels', os.path.basename(path))
+    if os.path.exists(other):
+        return other
+    return path
+
+class Recorder(object):
+    """Writes events to a recording as they happen"""
+    def __init__(self, path, sim_rate):
+        self.file = _open(path, 'w')
+        self.file.write('%s %d %r\n' % (HEADER, FORMAT_VERSION,
+                                        float(sim_rate)))
+
+    def _write(self, time, kind, *args):
+        self.file.write(' '.join([repr(float(time)), kind] +
+                                 [str(x) for x in args]) + '\n')
+
+    def level(self, time, path, status):
+        self._write(time, 'level', STATUS_NAMES[status],
+                    os.path.abspath(path))
+
+    def key(self, time, letter):
+        self._write(time, 'key', letter.encode('unicode_escape'))
+
+    def laser(self, time, on):
+        self._write(time, 'laser', int(bool(on)))
+
+    def restart(self, time):
+        self._write(time, 'restart')
+
+    def state(self, time, level):
+        self._write(time, 'state', STATUS_NAMES[level.status],
+                    repr(level.speed), repr(level.pos))
+
+    def close(self, time):
+        self._write(time, 'end')
+        self.file.close()
+
+class Recording(object):
+    """The events of a recording, as (time, kind, args) tuples"""
+    def __init__(self, sim_rate, events):
+        self.sim_rate = sim_rate
+        self.events = events
+
+    @classmethod
+    def load(cls, path):
+        f = _open(path)
+        try:
+            lines = f.read().splitlines()
+        finally:
+            f.close()
+        if not lines or not lines[0].startswith(HEADER + ' '):
+            raise ValueError('%s is not a shadowloss recording' % path)
+        version, sim_rate = lines[0].split()[1:3]
+        if int(version) != FORMAT_VERSION:
+            raise ValueError('%s has unknown recording version %s'
+                             % (path, version))
+        events = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            parts = line.split(' ', 2)
+            time, kind = float(parts[0]), parts[1]
+            rest = parts[2] if len(parts) > 2 else ''
+            if kind == 'level':
+                status, level_path = rest.split(' ', 1)
+                args = (level_path, STATUS_VALUES[status])
+            elif kind == 'key':
+                args = (rest.decode('unicode_escape'),)
+            elif kind == 'laser':
+                args = (rest == '1',)
+            elif kind == 'state':
+                status, speed, pos = rest.split()
+                args = (STATUS_VALUES[status], float(speed), float(pos))
+            else:
+                args = ()
+            events.append((time, kind, args))
+        return cls(float(sim_rate), events)
+
+    def level_paths(self, data_dir=None):
+        """Get the paths of all recorded levels, in order of first use"""
+        paths = []
+        for time, kind, args in self.events:
+            if kind == 'level':
+                path = resolve_level_path(args[0], data_dir)
+                if path not in paths:
+                    paths.append(path)
+        return paths
+
+class Replayer(object):
+    """
+    Feeds the events of a recording to a target, which must have the
+    methods press_letter and set_laser (taking the letter or state and
+    the time), restart_level and replay_level and the attribute
+    current_level
+    """
+    def __init__(self, recording, data_dir=None):
+        self.recording = recording
+        self.data_dir = data_dir
+        self.index = 0
+        self.finished = False
+        self.checks = 0
+        # (time, expected (status, speed, pos), actual)
+        self.mismatches = []
+
+    def apply(self, target, now, inputs_until=None):
+        """
+        Apply all events up to and including the time now, and the keys
+        and laser switches up to inputs_until, which are given their
+        times
+        """
+        events = self.recording.events
+        if inputs_until is None:
+            inputs_until = now
+        while self.index < len(events):
+            time, kind, args = events[self.index]
+            if time > now and not (time <= inputs_until and
+                                   kind in ('key', 'laser')):
+                break
+            self.index += 1
+            if kind == 'key':
+                target.press_letter(args[0], time)
+            elif kind == 'laser':
+                target.set_laser(args[0], time)
+            elif kind == 'restart':
+                target.restart_level()
+            elif kind == 'level':
+                target.replay_level(
+                    resolve_level_path(args[0], self.data_dir), args[1])
+            elif kind == 'state':
+                self.check(time, target.current_level, args)
+            elif kind == 'end':
+                self.finished = True
+                break
+        if self.index >= len(events):
+            self.finished = True
+
+    def check(self, time, level, expected):
+        self.checks += 1
+        actual = (level.status, level.speed, level.pos)
+        if actual[0] != expected[0] or \
+                not _close(actual[1], expected[1]) or \
+                not _close(actual[2], expected[2]):
+            self.mismatches.append((time, expected, actual))
+
+    def report(self):
+        if not self.mismatches:
+            return 'replay matched the recording (%d checks)' % self.checks
+        lines = ['replay differs from the recording in %d of %d checks:'
+                 % (len(self.mismatches), self.checks)]
+        for time, expected, actual in self.mismatches:
+            lines.append('  at %.3f s: expected %s, got %s' % (
+                    time / 1000.0, _format_state(expected),
+                    _format_state(actual)))
+        return '\n'.join(lines)
+
+def _close(a, b):
+    return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+
+def _format_state(state):
+    return '%s (speed %.5f, pos %.3f)' % (STATUS_NAMES[state[0]],
+                                         state[1], state[2])
+
+class HeadlessReplay(object):
+    """Replays a recording as fast as possible without a display"""
+    def __init__(self, recording, metrics=None, data_dir=None,
+                 level_cache=None):
+        self.parent = HeadlessParent(metrics, level_cache=level_cache)
+        self.replayer = Replayer(recording, data_dir)
+        self.step = 1000.0 / recording.sim_rate
+        self.levels = {}
+        self.current_level = None
+        self.inputs = []
+        self.sim_time = 0.0
+
+    def press_letter(self, letter, at):
+        self.inputs.append((at, KEY, letter))
+
+    def set_laser(self, on, at):
+        self.inputs.append((at, LASER, on))
+
+    def restart_level(self):
+        self.current_level.start()
+
+    def replay_level(self, path, status):
+        level = self.levels.get(path)
+        if level is None:
+            level = self.levels[path] = Level(self.parent, path)
+        self.current_level = level
+        level.switch_hook()
+        if status == PLAYING and level.status != PLAYING:
+            # It was loaded anew when it was recorded
+            level.reset()
+
+    def run(self):
+        """Replay everything. Returns the Replayer, which has the results."""
+        replayer = self.replayer
+        while True:
+            replayer.apply(self, self.sim_time, self.sim_time + self.step)
+            if replayer.finished:
+                break
+            # The same steps as World.run
+            self.sim_time += self.step
+            self.parent.time = self.sim_time
+            inputs, self.inputs = split_inputs(self.inputs, self.sim_time)
+            self.current_level.update((), self.sim_time, inputs)
+        return replayer
+
+def replay_headless(path, metrics=None, data_dir=None):
+    """Replay the recording in path without a display"""
+    return HeadlessReplay(Recording.load(path), metrics, data_dir).run()
+
+if __name__ == '__main__':
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__))), 'data')
+    metrics = default_font_metrics(data_dir)
+    failed = False
+    for path in sys.argv[1:]:
+        start = various.monotonic_time()
+        replay = HeadlessReplay(Recording.load(path), metrics, data_dir)
+        replayer = replay.run()
+        spent = various.monotonic_time() - start
+        print '%s: %s (%.0f level seconds per second)' % (
+            path, replayer.report(),
+            replay.sim_time / 1000.0 / max(spent, 1e-9))
+        failed = failed or bool(replayer.mismatches)
+    sys.exit(int(failed))
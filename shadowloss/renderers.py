@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.renderers
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Backends that draw shapes and surfaces on the
+                  # screen
+##[ Start date  ]## 2026 October 17
+
+# The world does all of its drawing through a renderer. Shapes are
+# queued and drawn no later than the next flush; surfaces are blitted
+# and rectangles filled at once. Colors are PyGame colors, (R, G, B)
+# with values from 0 to 255, and all positions are in screen pixels.
+
+import math
+import pygame
+
+try:
+    import shadowloss.cairogame as cairogame
+except ImportError:
+    cairogame = None
+
+try:
+    import pygame.gfxdraw as gfxdraw
+except ImportError:
+    gfxdraw = None
+
+class Renderer(object):
+    """Draws nothing but knows where things would have been drawn"""
+    name = 'null'
+
+    def __init__(self):
+        self.screen = None
+        self.antialias = True
+
+    def set_screen(self, surf):
+        self.screen = surf
+
+    def set_antialias(self, on):
+        """Smooth the edges of shapes drawn from now on, or not"""
+        self.antialias = on
+
+    def begin_frame(self, surf=None):
+        if surf is not None:
+            self.set_screen(surf)
+
+    def queue_line(self, color, start_pos, end_pos, line_width, surf=None):
+        pass
+
+    def queue_circle(self, color, pos, radius, line_width=0, surf=None):
+        pass
+
+    def queue_lines(self, color, lines, line_width, surf=None):
+        """Queue many (start_pos, end_pos) lines at once"""
+        for start_pos, end_pos in lines:
+            self.queue_line(color, start_pos, end_pos, line_width, surf)
+
+    def queue_circles(self, color, circles, line_width=0, surf=None):
+        """Queue many (pos, radius) circles at once"""
+        for pos, radius in circles:
+            self.queue_circle(color, pos, radius, line_width, surf)
+
+    def flush(self, surf=None):
+        """
+        Draw all queued shapes, or only those queued for surf if it is
+        given
+        """
+        pass
+
+    def blit(self, target, surf, pos, area=None):
+        """Draw surf on target. Returns the affected rectangle."""
+        if area is None:
+            rect = pygame.Rect(pos, surf.get_size())
+        else:
+            rect = pygame.Rect(pos, pygame.Rect(area).size)
+        return rect.clip(target.get_clip())
+
+    def fill_rect(self, target, color, rect):
+        """Fill a rectangle of target. Returns the affected rectangle."""
+        return pygame.Rect(rect).clip(target.get_clip())
+
+    def scale(self, surf, dest, smooth=True):
+        """Scale surf to the size of dest and draw it there"""
+        pass
+
+    def flip(self):
+        """Show the whole screen"""
+        pass
+
+    def update(self, rects):
+        """Show parts of the screen"""
+        pass
+
+NullRenderer = Renderer
+
+class _DisplayRenderer(Renderer):
+    def blit(self, target, surf, pos, area=None):
+        return target.blit(surf, pos, area)
+
+    def fill_rect(self, target, color, rect):
+        return pygame.draw.rect(target, color, rect)
+
+    def scale(self, surf, dest, smooth=True):
+        if smooth:
+            pygame.transform.smoothscale(surf, dest.get_size(), dest)
+        else:
+            pygame.transform.scale(surf, dest.get_size(), dest)
+
+    def flip(self):
+        pygame.display.flip()
+
+    def update(self, rects):
+        pygame.display.update(rects)
+
+class CairoRenderer(_DisplayRenderer):
+    """Draws antialiased shapes with cairo, in as few paths as possible"""
+    name = 'cairo'
+
+    def __init__(self):
+        if cairogame is None:
+            raise ImportError('no cairo')
+        _DisplayRenderer.__init__(self)
+
+    def set_screen(self, surf):
+        self.screen = surf
+        cairogame.set_screen(surf)
+
+    def set_antialias(self, on):
+        _DisplayRenderer.set_antialias(self, on)
+        cairogame.set_antialias(on)
+
+    def begin_frame(self, surf=None):
+        if surf is not None:
+            self.screen = surf
+        cairogame.begin_frame(surf)
+
+    def queue_line(self, color, start_pos, end_pos, line_width, surf=None):
+        cairogame.queue_line(color, start_pos, end_pos, line_width, surf)
+
+    def queue_circle(self, color, pos, radius, line_width=0, surf=None):
+        cairogame.queue_circle(color, pos, radius, line_width, surf)
+
+    def queue_lines(self, color, lines, line_width, surf=None):
+        cairogame.queue_lines(color, lines, line_width, surf)
+
+    def queue_circles(self, color, circles, line_width=0, surf=None):
+        cairogame.queue_circles(color, circles, line_width, surf)
+
+    def flush(self, surf=None):
+        cairogame.finish_draw(surf)
+
+class PygameRenderer(_DisplayRenderer):
+    """
+    Draws shapes with PyGame alone. Thick lines are filled polygons
+    with round ends. Consecutive shapes of the same color are drawn
+    together, antialiased edges first, so that the edges of one shape
+    never show on top of another.
+    """
+    name = 'pygame'
+
+    def __init__(self):
+        if gfxdraw is None:
+            raise ImportError('no pygame.gfxdraw')
+        _DisplayRenderer.__init__(self)
+        # [surface, color, shapes, antialias] lists, in the order they
+        # were queued
+        self.batches = []
+
+    def begin_frame(self, surf=None):
+        _DisplayRenderer.begin_frame(self, surf)
+        del self.batches[:]
+
+    def _queue(self, surf, color, shapes):
+        surf = surf or self.screen
+        if self.batches:
+            last = self.batches[-1]
+            if last[0] is surf and last[1] == color and \
+                    last[3] == self.antialias:
+                last[2].extend(shapes)
+                return
+        self.batches.append([surf, color, list(shapes), self.antialias])
+
+    def queue_line(self, color, start_pos, end_pos, line_width, surf=None):
+        self._queue(surf, color, _line_shapes(start_pos, end_pos,
+                                              line_width))
+
+    def queue_circle(self, color, pos, radius, line_width=0, surf=None):
+        self._queue(surf, color, _circle_shapes(pos, radius, line_width))
+
+    def queue_lines(self, color, lines, line_width, surf=None):
+        shapes = []
+        for start_pos, end_pos in lines:
+            shapes.extend(_line_shapes(start_pos, end_pos, line_width))
+        self._queue(surf, color, shapes)
+
+    def queue_circles(self, color, circles, line_width=0, surf=None):
+        shapes = []
+        for pos, radius in circles:
+            shapes.extend(_circle_shapes(pos, radius, line_width))
+        self._queue(surf, color, shapes)
+
+    def flush(self, surf=None):
+        if not self.batches:
+            return
+        if surf is None:
+            todo = self.batches[:]
+            del self.batches[:]
+        else:
+            todo = [x for x in self.batches if x[0] is surf]
+            self.batches[:] = [x for x in self.batches if x[0] is not surf]
+        for target, color, shapes, antialias in todo:
+            if antialias:
+                for shape in shapes:
+                    if shape[0] == _POLYGON:
+                        gfxdraw.aapolygon(target, shape[1], color)
+                    elif shape[0] == _DISC:
+                        gfxdraw.aacircle(target, shape[1], shape[2],
+                                         shape[3], color)
+            for shape in shapes:
+                kind = shape[0]
+                if kind == _POLYGON:
+                    gfxdraw.filled_polygon(target, shape[1], color)
+                elif kind == _DISC:
+                    gfxdraw.filled_circle(target, shape[1], shape[2],
+                                          shape[3], color)
+                elif kind == _AALINE:
+                    if antialias:
+                        pygame.draw.aaline(target, color, shape[1],
+                                           shape[2])
+                    else:
+                        pygame.draw.line(target, color, shape[1], shape[2])
+                elif kind == _RING:
+                    if shape[4] <= 1:
+                        if antialias:
+                            gfxdraw.aacircle(target, shape[1], shape[2],
+                                             shape[3], color)
+                        else:
+                            gfxdraw.circle(target, shape[1], shape[2],
+                                           shape[3], color)
+                    else:
+                        pygame.draw.circle(target, color,
+                                           (shape[1], shape[2]), shape[3],
+                                           shape[4])
+                else:
+                    target.set_at(shape[1], color)
+
+# The shapes the PyGame renderer draws
+_POLYGON = 1
+_DISC = 2
+_AALINE = 3
+_RING = 4
+_POINT = 5
+
+def _line_shapes(start_pos, end_pos, line_width):
+    """Split a line with round ends into shapes"""
+    radius = line_width / 2.0
+    if radius < 1:
+        return [(_AALINE, start_pos, end_pos)]
+    dx = end_pos[0] - start_pos[0]
+    dy = end_pos[1] - start_pos[1]
+    length = math.hypot(dx, dy)
+    shapes = [_disc(start_pos, radius), _disc(end_pos, radius)]
+    if length > 0:
+        nx = -dy / length * radius
+        ny = dx / length * radius
+        shapes.append((_POLYGON, [
+                    (int(round(start_pos[0] + nx)),
+                     int(round(start_pos[1] + ny))),
+                    (int(round(end_pos[0] + nx)),
+                     int(round(end_pos[1] + ny))),
+                    (int(round(end_pos[0] - nx)),
+                     int(round(end_pos[1] - ny))),
+                    (int(round(start_pos[0] - nx)),
+                     int(round(start_pos[1] - ny)))]))
+    return shapes
+
+def _circle_shapes(pos, radius, line_width):
+    if line_width > 0 and radius > line_width:
+        return [(_RING, int(round(pos[0])), int(round(pos[1])),
+                 int(round(radius)), int(round(line_width)))]
+    return [_disc(pos, radius)]
+
+def _disc(pos, radius):
+    x, y = int(round(pos[0])), int(round(pos[1]))
+    radius = int(round(radius))
+    if radius < 1:
+        return (_POINT, (x, y))
+    return (_DISC, x, y, radius)
+
+RENDERERS = {
+    'cairo': CairoRenderer,
+    'pygame': PygameRenderer,
+    'null': NullRenderer
+}
+
+def default_name():
+    """Get the name of the renderer used when none is given"""
+    if cairogame is not None:
+        return 'cairo'
+    return 'pygame'
+
+def create(name=None):
+    """
+    Create a renderer by name. Without a name, cairo is used if it is
+    available and PyGame otherwise. Raises KeyError if there is no such
+    renderer and ImportError if it is not available.
+    """
+    return RENDERERS[name or default_name()]()
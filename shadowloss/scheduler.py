@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.scheduler
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Keeps track of when things are due
+##[ Start date  ]## 2026 October 17
+
+from heapq import heappush, heappop, heapify
+
+# Deadlines are sums of times in milliseconds, so they can be off by a
+# little rounding. Events this close to being due are returned, and it
+# is up to the caller to check whether they really are.
+MARGIN = 1e-6
+
+class Scheduler(object):
+    """
+    Events sorted by deadline in a min-heap. Events are never removed
+    before they are due; whoever gets them from due() decides whether
+    they still apply.
+    """
+    def __init__(self):
+        self.heap = []
+        # Keeps events with the same deadline in the order they were
+        # added, and keeps the events themselves from being compared
+        self.order = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, deadline, event):
+        heappush(self.heap, (deadline, self.order, event))
+        self.order += 1
+
+    def add_many(self, events):
+        """Add (deadline, event) pairs"""
+        events = [(deadline, self.order + i, event)
+                  for i, (deadline, event) in enumerate(events)]
+        self.order += len(events)
+        self.heap.extend(events)
+        heapify(self.heap)
+
+    def due(self, now):
+        """Remove and get the (deadline, event) pairs due at now"""
+        found = []
+        heap = self.heap
+        limit = now + MARGIN
+        while heap and heap[0][0] <= limit:
+            deadline, order, event = heappop(heap)
+            found.append((deadline, event))
+        return found
+
+    def clear(self):
+        del self.heap[:]
+
+    def save(self):
+        return self.heap[:], self.order
+
+    def restore(self, state):
+        heap, self.order = state
+        self.heap[:] = heap
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.simulation
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Plays levels without a display
+##[ Start date  ]## 2026 October 17
+
+import os
+import sys
+import shadowloss.various as various
+import shadowloss.generalinformation as ginfo
+from shadowloss.level import Level, PLAYING, WON, LOST, DEFAULT_SIM_RATE, \
+    KEY, LASER, read_level_data
+
+STATUS_NAMES = {PLAYING: 'playing', WON: 'won', LOST: 'lost'}
+
+def font_path(data_dir=None):
+    return os.path.join(data_dir or ginfo.global_data_dir, 'fonts',
+                        'UniversalisADFCdStd-Bold.otf')
+
+class FontMetrics(object):
+    """Text sizes exactly as the game computes them (needs pygame)"""
+    def __init__(self, path):
+        import pygame
+        from shadowloss.glyphatlas import GlyphAtlas
+        pygame.font.init()
+        self.atlas = GlyphAtlas(path)
+        self.sizes = {}
+
+    def text_size(self, text, height):
+        size = self.sizes.get((text, height))
+        if size is None:
+            size = self.sizes[(text, height)] = \
+                self.atlas.text_size(text, height)
+        return size
+
+class ApproximateFontMetrics(object):
+    """Text sizes guessed from the number of characters"""
+    def __init__(self, width_ratio=0.45):
+        self.width_ratio = width_ratio
+
+    def text_size(self, text, height):
+        return max(1, int(len(text) * height * self.width_ratio)), \
+            max(1, int(height))
+
+# Loaded font metrics by data directory
+_font_metrics = {}
+
+def default_data_dir(data_dir=None):
+    """
+    Get data_dir, or without one the installed data, or the data next
+    to this package if nothing is installed
+    """
+    if data_dir is None:
+        data_dir = ginfo.global_data_dir
+        if not os.path.exists(font_path(data_dir)):
+            data_dir = os.path.join(os.path.dirname(os.path.dirname(
+                os.path.realpath(__file__))), 'data')
+    return data_dir
+
+def default_font_metrics(data_dir=None):
+    """
+    Get the game's own text sizes, or guessed ones if pygame is missing.
+    The data directory is found with default_data_dir. Raises IOError
+    if the font is not in it.
+    """
+    data_dir = default_data_dir(data_dir)
+    metrics = _font_metrics.get(data_dir)
+    if metrics is None:
+        path = font_path(data_dir)
+        if not os.path.exists(path):
+            raise IOError('font not found: %s' % path)
+        try:
+            metrics = FontMetrics(path)
+        except ImportError:
+            metrics = ApproximateFontMetrics()
+        _font_metrics[data_dir] = metrics
+    return metrics
+
+class HeadlessParent(object):
+    """Stands in for the World when a level is played without a display"""
+    virtual_size = (600, 200)
+    use_pose_cache = False
+    max_ghosts = 0
+
+    def __init__(self, metrics=None, term_verbose=False, level_cache=None):
+        # Pass ApproximateFontMetrics() to skip loading the font
+        self.metrics = metrics or default_font_metrics()
+        self.level_cache = level_cache
+        self.term_verbose = term_verbose
+        self.shooting = False
+        self.time = 0.0
+
+    def error(self, msg, done=None):
+        if self.term_verbose:
+            various.usable_error(msg, done)
+
+    def debug_print(self, text):
+        pass
+
+    def get_time(self):
+        return self.time
+
+    def read_level(self, path):
+        if self.level_cache is not None:
+            return self.level_cache.read(path)
+        return read_level_data(path)
+
+    def text_size(self, text, text_height=75):
+        return self.metrics.text_size(text, text_height)
+
+    def create_text(self, text, text_height=75, color=None):
+        return None
+
+    def fill_borders(self, color=None):
+        pass
+
+    def clear_sprite_cache(self):
+        pass
+
+    def mark_phase(self, phase):
+        pass
+
+    def play_sound(self, name):
+        pass
+
+class SimulationResult(object):
+    def __init__(self, level, time, trajectory):
+        self.status = level.status
+        self.time = time
+        self.pos = level.pos
+        self.speed = level.speed
+        self.trajectory = trajectory
+
+    def __repr__(self):
+        return '<%s after %.3f s: pos %.3f, speed %.5f>' % (
+            STATUS_NAMES[self.status], self.time / 1000.0, self.pos,
+            self.speed)
+
+class Simulation(object):
+    """
+    Plays a level in fixed time steps (in milliseconds) with input from
+    a timeline instead of from the keyboard.
+    """
+    def __init__(self, path, step=1000.0 / DEFAULT_SIM_RATE, metrics=None,
+                 parent=None):
+        self.parent = parent or HeadlessParent(metrics)
+        self.step = float(step)
+        self.level = Level(self.parent, path)
+
+    def run(self, timeline=(), max_time=3600 * 1000, trajectory=False):
+        """
+        Play the level from the start until it is won or lost, or
+        until max_time. timeline is a list of (time, kind, value)
+        tuples sorted by time, where kind is KEY (value is the
+        letter) or LASER (value is True or False). The level is
+        advanced to the time of every input before it is applied.
+
+        If trajectory is true, (time, pos, speed) of every step is
+        included in the result.
+        """
+        level = self.level
+        parent = self.parent
+        parent.shooting = False
+        parent.time = 0.0
+        level.start(0.0)
+        timeline = sorted([(time, kind,
+                            value.lower() if kind == KEY else value)
+                           for time, kind, value in timeline],
+                          key=lambda x: x[0])
+        n = len(timeline)
+        i = 0
+        t = 0.0
+        steps = 0
+        points = [] if trajectory else None
+        while level.status == PLAYING and t < max_time:
+            steps += 1
+            t = steps * self.step
+            parent.time = t
+            j = i
+            while j < n and timeline[j][0] <= t:
+                j += 1
+            level.update((), t, timeline[i:j])
+            i = j
+            if points is not None:
+                points.append((t, level.pos, level.speed))
+        return SimulationResult(level, t, points)
+
+if __name__ == '__main__':
+    import time
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__))), 'data')
+    metrics = default_font_metrics(data_dir)
+    for path in sys.argv[1:]:
+        sim = Simulation(path, metrics=metrics)
+        start = time.time()
+        result = sim.run()
+        spent = time.time() - start
+        print '%s: %r (%.0f level seconds per second)' % (
+            path, result, result.time / 1000.0 / max(spent, 1e-9))
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.solver
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Searches for the best way to play a level
+##[ Start date  ]## 2026 October 17
+
+# The solver plays a level with the real Level rules, in the same fixed
+# steps as Simulation, and searches all reasonable inputs one step at a
+# time (a breadth-first search over time):
+#
+#  * when the stickfigure is on a letter, its text is either typed at
+#    once or not yet (typing anything else only makes things worse);
+#  * whenever a number becomes the next object, the laser is either
+#    turned on until the next object changes or kept off. Running into
+#    a number is not always worse: its speed increase can bring the
+#    stickfigure to the next letter before the speed has grown as much.
+#    The laser is never used on letters, since that would waste them.
+#
+# States which are the same up to a small rounding are merged, states
+# which are both faster and further ahead than another state in the
+# same situation are dropped, and at most beam_width states are kept of
+# every step, taking the slowest states of every situation in turn. The
+# first step in which a state has won thus gives the fastest win that
+# the beam found. A win that needs a state the beam dropped is missed,
+# so finding no win does not prove that a level cannot be won.
+
+import os
+import sys
+from shadowloss.level import Level, PLAYING, WON, LOST, DEFAULT_SIM_RATE
+from shadowloss.simulation import HeadlessParent, Simulation, \
+    default_font_metrics, KEY, LASER, STATUS_NAMES
+
+class _Node(object):
+    __slots__ = ('state', 'parent', 'events', 'laser', 'target', 'keys')
+
+    def __init__(self, state, parent, events, laser, target, keys):
+        self.state = state
+        self.parent = parent
+        self.events = events
+        self.laser = laser
+        self.target = target
+        self.keys = keys
+
+    def timeline(self):
+        events = []
+        node = self
+        while node is not None:
+            events.extend(reversed(node.events))
+            node = node.parent
+        events.reverse()
+        return events
+
+class SolverResult(object):
+    def __init__(self, path, level, winnable, time, node, expanded,
+                 beam_width):
+        self.path = path
+        # Whether a win was found; without one, the level may still be
+        # winnable with a wider beam
+        self.winnable = winnable
+        self.beam_width = beam_width
+        self.time = time
+        self.length = level.length
+        self.expanded = expanded
+        self.timeline = node.timeline() if node is not None else []
+        if node is not None:
+            level.restore_state(node.state)
+        self.status = level.status
+        self.pos = level.pos
+        self.speed = level.speed
+        self.keys = node.keys if node is not None else 0
+        self.verified = None
+
+    @property
+    def margin(self):
+        """How far from the wall the stickfigure is when it has won"""
+        if not self.winnable:
+            return 0.0
+        return self.length - self.pos
+
+    @property
+    def difficulty(self):
+        """
+        Keys per second needed, divided by the part of the level left
+        as margin: more typing and less room make a level harder
+        """
+        if not self.winnable:
+            return float('inf')
+        keys_per_second = self.keys / max(self.time / 1000.0, 1e-9)
+        return keys_per_second / max(self.margin / float(self.length), 0.01)
+
+    def report(self):
+        info = {
+            'path': self.path,
+            'winnable': self.winnable,
+            'time': self.time / 1000.0,
+            'margin': self.margin,
+            'difficulty': self.difficulty,
+            'keys': self.keys,
+            'shots': len([x for x in self.timeline
+                          if x[1] == LASER and x[2]]),
+            'states': self.expanded,
+            'beam_width': self.beam_width,
+            'verified': self.verified
+            }
+        if not self.winnable:
+            info['status'] = STATUS_NAMES[self.status]
+            info['speed'] = self.speed
+        return info
+
+class Solver(object):
+    """Finds the fastest way to win a level"""
+    def __init__(self, path, metrics=None, step=1000.0 / DEFAULT_SIM_RATE,
+                 beam_width=256, max_time=600 * 1000,
+                 speed_resolution=1e-4, pos_resolution=1e-2):
+        self.path = path
+        self.metrics = metrics
+        self.parent = HeadlessParent(metrics)
+        self.level = Level(self.parent, path)
+        self.step = float(step)
+        self.beam_width = int(beam_width)
+        self.max_time = max_time
+        self.speed_resolution = speed_resolution
+        self.pos_resolution = pos_resolution
+        self.expanded = 0
+
+    def solve(self, verify=True):
+        level = self.level
+        self.parent.time = 0.0
+        self.parent.shooting = False
+        level.start(0.0)
+        layer = [_Node(level.save_state(), None, (), False, None, 0)]
+        steps = 0
+        t = 0.0
+        slowest_loss = None
+        while layer and t < self.max_time:
+            # The same times as Simulation.run
+            steps += 1
+            t = steps * self.step
+            self.parent.time = t
+            children = {}
+            won = []
+            for node in layer:
+                for child in self.expand(node, t):
+                    status = child.state.status
+                    if status == WON:
+                        won.append(child)
+                    elif status == LOST:
+                        if slowest_loss is None or \
+                                child.state.speed < \
+                                slowest_loss.state.speed:
+                            slowest_loss = child
+                    else:
+                        self.merge(children, child)
+            if won:
+                # Of the fastest wins, take the one furthest from the wall
+                best = min(won, key=lambda x: x.state.pos)
+                return self.finish(True, t, best, verify)
+            layer = self.prune(children.values())
+        if layer:
+            # Still playing at max_time
+            best = min(layer, key=lambda x: x.state.speed)
+        else:
+            best = slowest_loss
+        return self.finish(False, t, best, False)
+
+    def finish(self, winnable, t, node, verify):
+        result = SolverResult(self.path, self.level, winnable, t, node,
+                              self.expanded, self.beam_width)
+        if verify:
+            sim = Simulation(self.path, self.step, parent=self.parent)
+            sim_result = sim.run(result.timeline, t + self.step)
+            result.verified = sim_result.status == WON and \
+                sim_result.time == t
+        return result
+
+    def expand(self, node, t):
+        level = self.level
+        level.restore_state(node.state)
+        next_obj = level.next_obj
+        if next_obj is not None and next_obj.type == 'number':
+            if node.target is next_obj:
+                lasers = (node.laser,)
+            else:
+                lasers = (False, True)
+        else:
+            lasers = (False,)
+
+        # Inputs are applied at t, after the level has moved there, like
+        # in Simulation.run, so the laser chosen now shoots from the
+        # next step on. Moving does not depend on the input, so the
+        # letter that will be under the stickfigure is known after
+        # trying one update.
+        text = None
+        for laser in lasers:
+            events = self.events(node, t, laser, ())
+            level.restore_state(node.state)
+            self.parent.shooting = node.laser
+            level.update((), t, events)
+            self.expanded += 1
+            yield self.child(node, laser, next_obj, (), events)
+            if text is None:
+                pos = level.pos
+                level.restore_state(node.state)
+                obj = level.letters.first_covering(pos)
+                if obj is None:
+                    text = ''
+                else:
+                    part = obj.get_current_part()
+                    text = part.letter.lower()[len(part.temp_text):]
+            if text:
+                events = self.events(node, t, laser, text)
+                level.restore_state(node.state)
+                self.parent.shooting = node.laser
+                level.update((), t, events)
+                self.expanded += 1
+                yield self.child(node, laser, next_obj, text, events)
+
+    def events(self, node, t, laser, text):
+        events = [(t, KEY, x) for x in text]
+        if laser != node.laser:
+            events.insert(0, (t, LASER, laser))
+        return events
+
+    def child(self, node, laser, target, text, events):
+        return _Node(self.level.save_state(), node, tuple(events), laser,
+                     target, node.keys + len(text))
+
+    def situation(self, node):
+        # What must be the same for two states to be compared
+        state = node.state
+        return (tuple(state.letters[0]), tuple(state.numbers[0]),
+                node.laser, state.current_temp_speed_increase,
+                state.current_temp_speed_duration,
+                state.current_temp_speed_time)
+
+    def merge(self, children, node):
+        state = node.state
+        shooting = state.next_obj.time_shooting \
+            if state.next_obj is not None else 0
+        key = self.situation(node) + (
+            int(round(state.speed / self.speed_resolution)),
+            int(round(state.pos / self.pos_resolution)),
+            int(round(shooting)))
+        old = children.get(key)
+        if old is None or (state.speed, state.pos) < (old.state.speed,
+                                                       old.state.pos):
+            children[key] = node
+
+    def prune(self, nodes):
+        # Drop states which are slower and further ahead than another
+        # state in the same situation
+        groups = {}
+        for node in nodes:
+            groups.setdefault(self.situation(node), []).append(node)
+        fronts = []
+        for group in groups.itervalues():
+            group.sort(key=lambda x: (x.state.speed, x.state.pos))
+            front = []
+            lowest_pos = float('inf')
+            for node in group:
+                if node.state.pos < lowest_pos:
+                    front.append(node)
+                    lowest_pos = node.state.pos
+            fronts.append(front)
+        fronts.sort(key=lambda x: (x[0].state.speed, x[0].state.pos))
+        kept = []
+        i = 0
+        while len(kept) < self.beam_width and fronts:
+            fronts = [x for x in fronts if len(x) > i]
+            kept.extend(x[i] for x in fronts[:self.beam_width - len(kept)])
+            i += 1
+        return kept
+
+_metrics = {}
+
+def _solve(args):
+    path, data_dir, options = args
+    # Font metrics are loaded once per process
+    metrics = _metrics.get(data_dir)
+    if metrics is None:
+        metrics = _metrics[data_dir] = default_font_metrics(data_dir)
+    result = Solver(path, metrics, **options).solve()
+    info = result.report()
+    info['timeline'] = result.timeline
+    return info
+
+def solve_many(paths, data_dir=None, processes=None, **options):
+    """
+    Solve many levels, in parallel with processes processes (all cores
+    by default). Returns a list of reports (dicts).
+    """
+    jobs = [(path, data_dir, options) for path in paths]
+    if processes == 1 or len(jobs) < 2:
+        return map(_solve, jobs)
+    import multiprocessing
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_solve, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def format_report(info):
+    if info['winnable']:
+        text = 'won after %.2f s, %.1f from the wall, difficulty %.2f ' \
+            '(%d keys, %d shots)' % (info['time'], info['margin'],
+                                    info['difficulty'], info['keys'],
+                                    info['shots'])
+        if info['verified'] is False:
+            text += ', NOT VERIFIED'
+    else:
+        text = 'no win found with beam width %d (best: %s after %.2f s ' \
+            'at speed %.3f)' % (info['beam_width'], info['status'],
+                                info['time'], info['speed'])
+    return '%s: %s [%d states]' % (info['path'], text, info['states'])
+
+def format_timeline(timeline):
+    lines = []
+    for time, kind, value in timeline:
+        if kind == KEY:
+            lines.append('  %9.1f ms  type %s' % (time, value))
+        else:
+            lines.append('  %9.1f ms  laser %s' % (time, ['off', 'on'][value]))
+    return '\n'.join(lines)
+
+def main(args=None):
+    from optparse import OptionParser
+    import shadowloss.generalinformation as ginfo
+    parser = OptionParser(
+        prog=ginfo.program_name + '-solver',
+        usage='Usage: %prog [OPTION]... LEVEL...',
+        description='Find the fastest way to win levels, and how hard \
+they are.')
+    parser.add_option('-d', '--data-dir', dest='data_dir', metavar='PATH',
+                      help='where the game data (the font) is (default: \
+the installed data)')
+    parser.add_option('-j', '--jobs', dest='processes', type='int',
+                      metavar='NUMBER',
+                      help='solve this many levels at once (default: the \
+number of cores)')
+    parser.add_option('-b', '--beam-width', dest='beam_width', type='int',
+                      default=256, metavar='NUMBER',
+                      help='the number of states kept per step')
+    parser.add_option('-m', '--max-time', dest='max_time', type='float',
+                      default=600, metavar='SECONDS',
+                      help='give up on levels taking longer than this')
+    parser.add_option('-t', '--timeline', dest='show_timeline',
+                      action='store_true',
+                      help='show the inputs of the solutions')
+    options, paths = parser.parse_args(args)
+    if not paths:
+        parser.error('no levels given')
+
+    reports = solve_many(paths, options.data_dir, options.processes,
+                         beam_width=options.beam_width,
+                         max_time=options.max_time * 1000)
+    for info in reports:
+        print format_report(info)
+        if options.show_timeline and info['winnable']:
+            print format_timeline(info['timeline'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.sound
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Plays short sound effects with little delay
+##[ Start date  ]## 2026 October 17
+
+# All sound effects are made ready when the game starts: a sound file
+# in the "sounds" data directory is decoded once, and a missing one is
+# synthesized. They are played on a fixed set of mixer channels; when
+# they are all busy, the sound that started first is cut off.
+
+import os
+import math
+from array import array
+import pygame
+import shadowloss.various as various
+
+FREQUENCY = 44100
+
+# The sounds, and (frequency at start, frequency at end, duration in
+# seconds) of each of their notes
+SOUNDS = {
+    'letter': [(880, 880, 0.05)],
+    'wrong': [(140, 120, 0.12)],
+    'laser': [(1800, 600, 0.15)],
+    'number': [(660, 660, 0.07), (990, 990, 0.07)],
+    'win': [(523, 523, 0.09), (659, 659, 0.09), (784, 784, 0.09),
+            (1047, 1047, 0.2)],
+    'lose': [(300, 300, 0.12), (240, 240, 0.12), (180, 180, 0.3)]
+}
+
+# Sounds caused directly by a key press
+INPUT_SOUNDS = ('letter', 'wrong', 'laser')
+
+def synthesize(notes, frequency=FREQUENCY, channels=2, volume=0.3):
+    """
+    Create signed 16-bit samples of notes, each a sine sweep which
+    fades out
+    """
+    samples = array('h')
+    amplitude = volume * 32767
+    for start, end, duration in notes:
+        n = int(duration * frequency)
+        phase = 0.0
+        for i in xrange(n):
+            t = i / float(n)
+            phase += 2 * math.pi * (start + (end - start) * t) / frequency
+            # Fade in quickly to avoid a click, and then out
+            envelope = min(1.0, i / 64.0) * (1 - t) ** 2
+            value = int(amplitude * envelope * math.sin(phase))
+            samples.extend([value] * channels)
+    return samples
+
+class SoundBank(object):
+    """Sound effects ready to be played on a fixed number of voices"""
+    def __init__(self, data_dir, voices=8):
+        frequency, size, channels = pygame.mixer.get_init()
+        self.frequency = frequency
+        self.sounds = {}
+        for name, notes in SOUNDS.iteritems():
+            sound = self.load(os.path.join(data_dir, 'sounds', name))
+            if sound is None:
+                if size != -16:
+                    # Only signed 16-bit samples are synthesized
+                    continue
+                sound = pygame.mixer.Sound(buffer=synthesize(
+                        notes, frequency, channels).tostring())
+            self.sounds[name] = sound
+
+        self.voices = int(voices)
+        pygame.mixer.set_num_channels(max(self.voices,
+                                          pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(self.voices)
+        self.channels = [pygame.mixer.Channel(i) for i in range(self.voices)]
+        self.started = array('d', [0.0]) * self.voices
+        self.stolen = 0
+
+    def load(self, path):
+        for ext in ('.ogg', '.wav'):
+            if os.path.isfile(path + ext):
+                return pygame.mixer.Sound(path + ext)
+        return None
+
+    def play(self, name):
+        """Play a sound on a free voice, or on the oldest one"""
+        sound = self.sounds.get(name)
+        if sound is None:
+            return
+        oldest = 0
+        for i in xrange(self.voices):
+            if not self.channels[i].get_busy():
+                break
+            if self.started[i] < self.started[oldest]:
+                oldest = i
+        else:
+            i = oldest
+            self.stolen += 1
+        self.channels[i].play(sound)
+        self.started[i] = various.monotonic_time()
+
+def buffer_latency(buffer_size):
+    """
+    Get how many milliseconds a sound can wait in the mixer before it
+    is heard
+    """
+    frequency = pygame.mixer.get_init()[0]
+    return 1000.0 * buffer_size / frequency
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shadowloss: a stickman-oriented game against time
+# Copyright (C) 2010  Niels Serup
+
+# This file is part of shadowloss.
+#
+# shadowloss is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# shadowloss is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with shadowloss.  If not, see <http://www.gnu.org/licenses/>.
+
+##[ Name        ]## shadowloss.spritecache
+##[ Maintainer  ]## Niels Serup <ns@metanohi.org>
+##[ Description ]## Keeps rendered stickfigure frames around
+##[ Start date  ]## 2026 October 17
+
+from collections import OrderedDict
+
+class SpriteCache(object):
+    """
+    A cache of rendered stickfigure frames. Sprites are stored by
+    (stickfigure, step bucket, speed bucket, color, zoom) and the least
+    recently used ones are dropped when the cache grows beyond
+    max_bytes.
+    """
+    def __init__(self, max_bytes=16 * 1024 * 1024, step_resolution=4):
+        self.max_bytes = max_bytes
+        self.step_resolution = step_resolution
+        self.sprites = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.zoom = None
+
+    def quantize_step(self, step):
+        """Get the step that all steps in the same bucket are drawn as"""
+        step = step % 1000
+        return int(step / self.step_resolution) * self.step_resolution
+
+    def check_zoom(self, zoom):
+        """Drop all sprites if they were rendered at another zoom"""
+        if zoom != self.zoom:
+            self.invalidate()
+            self.zoom = zoom
+
+    def get(self, key):
+        """Get (surface, top left point) of a sprite, or None"""
+        sprite = self.sprites.pop(key, None)
+        if sprite is None:
+            self.misses += 1
+            return None
+        self.sprites[key] = sprite
+        self.hits += 1
+        return sprite
+
+    def add(self, key, surf, point):
+        old = self.sprites.pop(key, None)
+        if old is not None:
+            self.used_bytes -= self._size_of(old[0])
+        size = self._size_of(surf)
+        if size > self.max_bytes:
+            return
+        while self.sprites and self.used_bytes + size > self.max_bytes:
+            self.used_bytes -= self._size_of(self.sprites.popitem(last=False)[1][0])
+        self.sprites[key] = surf, point
+        self.used_bytes += size
+
+    def invalidate(self):
+        self.sprites.clear()
+        self.used_bytes = 0
+
+    def _size_of(self, surf):
+        width, height = surf.get_size()
+        return width * height * surf.get_bytesize()
+
+    def stats(self):
+        return 'sprites: %d (%d KiB), hits: %d, misses: %d' % (
+            len(self.sprites), self.used_bytes / 1024, self.hits, self.misses)
@@ -25,13 +25,19 @@
 ##[ Start date  ]## 2010 September 12
 
 import math
+from collections import OrderedDict
 
 LINE = 1
 CIRCLE = 2
 
 class StickFigure(object):
-    def __init__(self, parent, offset_x=None, offset_y=None):
+    def __init__(self, parent, offset_x=None, offset_y=None,
+                 cacheable=True):
         self.parent = parent
+        # Stickfigures whose angle and length functions depend on
+        # anything but the step and the speed must not be cached.
+        self.cacheable = cacheable
+        self.pose_cache = None
         if offset_x is None:
             self.get_offset_x = lambda info: 0
         else:
@@ -51,7 +57,31 @@ class StickFigure(object):
     def add_circle(self, pos, radius):
         self.objects.append((CIRCLE, pos, radius))
 
+    def enable_pose_cache(self, speed_resolution=0.05, max_speed_buckets=16):
+        """
+        Use precomputed poses instead of generating the body on every
+        call. Returns False if this stickfigure cannot be cached.
+        """
+        if not self.cacheable:
+            return False
+        self.pose_cache = PoseCache(self, speed_resolution,
+                                    max_speed_buckets)
+        return True
+
+    def disable_pose_cache(self):
+        self.pose_cache = None
+
     def generate_body(self, step=0, speed=1):
+        """
+        Get the objects, joints and size of the body at the given step
+        and speed. Poses from the pose cache are shared and must not
+        be modified.
+        """
+        if self.pose_cache is not None:
+            return self.pose_cache.get(step, speed)
+        return self.build_body(step, speed)
+
+    def build_body(self, step=0, speed=1):
         step = step % 1000
         self.info.step = step
         self.info.speed = speed
@@ -143,9 +173,100 @@ class StickFigure(object):
     def end(self):
         pass
 
+class PoseCache(object):
+    """
+    Caches the poses of a stickfigure. Every speed bucket has a table
+    with one pose for every whole step; poses are generated the first
+    time they are needed, and poses between two steps are
+    interpolated. Only the most recently used speed buckets are kept.
+    """
+    def __init__(self, figure, speed_resolution=0.05, max_speed_buckets=16):
+        self.figure = figure
+        self.speed_resolution = float(speed_resolution)
+        self.max_speed_buckets = max(1, int(max_speed_buckets))
+        self.tables = OrderedDict()
+
+    def speed_bucket(self, speed):
+        return int(math.floor(speed / self.speed_resolution + 0.5))
+
+    def get_table(self, bucket):
+        table = self.tables.pop(bucket, None)
+        if table is None:
+            table = [None] * 1000
+            while len(self.tables) >= self.max_speed_buckets:
+                self.tables.popitem(last=False)
+        self.tables[bucket] = table
+        return table
+
+    def get_pose(self, table, bucket, step):
+        pose = table[step]
+        if pose is None:
+            pose = table[step] = _flatten_pose(self.figure.build_body(
+                step, bucket * self.speed_resolution))
+        return pose
+
+    def bake(self, speed):
+        """Generate all poses of a speed at once"""
+        bucket = self.speed_bucket(speed)
+        table = self.get_table(bucket)
+        for i in range(1000):
+            self.get_pose(table, bucket, i)
+
+    def clear(self):
+        self.tables.clear()
+
+    def get(self, step, speed):
+        step = step % 1000
+        bucket = self.speed_bucket(speed)
+        table = self.get_table(bucket)
+        i = int(step)
+        a = self.get_pose(table, bucket, i)
+        frac = step - i
+        if not frac:
+            return a[0]
+        b = self.get_pose(table, bucket, (i + 1) % 1000)
+        return _unflatten_pose(a, [x + (y - x) * frac for x, y
+                                   in zip(a[1], b[1])])
+
+def _flatten_pose(pose):
+    # Store a pose together with all of its numbers in one flat list,
+    # which makes interpolating between two poses cheap.
+    objs, points, size = pose
+    flat = []
+    for x in objs:
+        flat.extend(x[1])
+        if x[0] == LINE:
+            flat.extend(x[2])
+        elif x[0] == CIRCLE:
+            flat.append(x[2])
+    keys = sorted(points)
+    for key in keys:
+        flat.extend(points[key])
+    flat.extend(size)
+    return pose, flat, keys
+
+def _unflatten_pose(template, flat):
+    # Build a pose with the structure of template and the numbers of
+    # flat
+    i = 0
+    objs = []
+    for x in template[0][0]:
+        if x[0] == LINE:
+            objs.append((LINE, flat[i:i + 2], flat[i + 2:i + 4], x[3]))
+            i += 4
+        elif x[0] == CIRCLE:
+            objs.append((CIRCLE, flat[i:i + 2], flat[i + 2]))
+            i += 3
+    points = {}
+    for key in template[2]:
+        points[key] = flat[i:i + 2]
+        i += 2
+    return objs, points, (flat[i], flat[i + 1])
+
 class LinearChange(object):
     def __init__(self, *intervals, **kwds):
         measure = kwds.get('measure') or 'step'
+        self.measure = measure
         if measure == 'speed':
             self.get_measure = lambda info: info.speed
         else:
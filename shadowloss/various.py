@@ -25,6 +25,7 @@
 ##[ Start date  ]## 2010 September 13
 
 import sys
+import time
 from threading import Thread
 import shadowloss.generalinformation as ginfo
 try:
@@ -50,6 +51,36 @@ def usable_error(msg, done=None, **kwds):
 
 nothing = lambda *a: None
 
+def _find_monotonic_time():
+    # Prefer a high-resolution clock that never goes backwards. Python
+    # 2 has none, so try to get one from the C library before falling
+    # back to the wall clock.
+    for name in ('perf_counter', 'monotonic'):
+        if hasattr(time, name):
+            return getattr(time, name)
+    try:
+        import ctypes
+        import ctypes.util
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or
+                            ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        ts = timespec()
+        CLOCK_MONOTONIC = 1
+        def monotonic():
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+        monotonic()
+        return monotonic
+    except Exception:
+        return time.time
+
+# The time in seconds from some fixed point
+monotonic_time = _find_monotonic_time()
+
 class Container:
     pass
 
@@ -25,12 +25,22 @@
 ##[ Start date  ]## 2010 September 13
 
 import os
+import math
 import pygame
 from pygame.locals import *
 import fnmatch
 from shadowloss.settingsparser import SettingsParser
 from shadowloss.level import *
-import shadowloss.cairogame as cairogame
+from shadowloss.spritecache import SpriteCache
+from shadowloss.glyphatlas import GlyphAtlas
+from shadowloss.levelcache import LevelCache
+from shadowloss.frametimer import FrameTimer, percentile
+from shadowloss.sound import SoundBank, INPUT_SOUNDS, buffer_latency
+from shadowloss.recording import Recorder, Recording, Replayer
+from shadowloss.stickfigure import LINE, CIRCLE
+import shadowloss.renderers as renderers
+import shadowloss.governor as governor
+import shadowloss.ghosts as ghosts
 import shadowloss.various as various
 import shadowloss.generalinformation as ginfo
 
@@ -50,7 +60,28 @@ config_file_translations = {
     'doublebuf': 'use_doublebuf',
     'max fps': 'max_fps',
     'show debug': 'show_debug',
-    'mute': 'mute'
+    'mute': 'mute',
+    'pose cache': 'use_pose_cache',
+    'pose speed resolution': 'pose_speed_resolution',
+    'pose cache size': 'pose_cache_size',
+    'sprite cache': 'use_sprite_cache',
+    'sprite cache size': 'sprite_cache_size',
+    'sim rate': 'sim_rate',
+    'max sim steps': 'max_sim_steps',
+    'dirty rects': 'use_dirty_rects',
+    'dirty rect threshold': 'dirty_rect_threshold',
+    'level cache': 'use_level_cache',
+    'level cache dir': 'level_cache_dir',
+    'level window': 'level_window',
+    'timing hud': 'show_timing_hud',
+    'timing file': 'timing_file',
+    'timing samples': 'timing_samples',
+    'ghosts': 'max_ghosts',
+    'renderer': 'renderer_name',
+    'render scale': 'render_scale',
+    'smooth scaling': 'use_smooth_scaling',
+    'mixer buffer': 'mixer_buffer',
+    'quality tier': 'quality_tier'
 }
 
 class World(SettingsParser):
@@ -74,8 +105,119 @@ class World(SettingsParser):
         self.set_if_nil('max_fps', None)
         self.set_if_nil('show_debug', False)
         self.set_if_nil('mute', False)
+        self.set_if_nil('use_pose_cache', True)
+        self.set_if_nil('pose_speed_resolution', 0.05)
+        self.set_if_nil('pose_cache_size', 16)
+        self.set_if_nil('use_sprite_cache', True)
+        self.set_if_nil('sprite_cache_size', 16) # MiB
+        self.set_if_nil('sim_rate', DEFAULT_SIM_RATE)
+        self.set_if_nil('max_sim_steps', 8)
+        self.set_if_nil('use_dirty_rects', False)
+        self.set_if_nil('dirty_rect_threshold', 0.5)
+        self.set_if_nil('use_level_cache', True)
+        self.set_if_nil('level_cache_dir', None)
+        self.set_if_nil('rebuild_level_cache', False)
+        self.set_if_nil('level_window', 1)
+        self.set_if_nil('show_timing_hud', False)
+        self.set_if_nil('timing_file', None)
+        self.set_if_nil('timing_samples', 600)
+        self.set_if_nil('max_ghosts', 0)
+        self.set_if_nil('record_path', None)
+        self.set_if_nil('replay_path', None)
+        self.set_if_nil('renderer_name', None)
+        self.set_if_nil('render_scale', None)
+        self.set_if_nil('use_smooth_scaling', True)
+        self.set_if_nil('mixer_buffer', 512)
+        self.set_if_nil('measure_sound_latency', False)
+        self.set_if_nil('quality_tier', 'auto')
+
+        renderer_name = self.renderer_name or renderers.default_name()
+        try:
+            self.renderer = renderers.create(renderer_name)
+        except KeyError:
+            self.error('unknown renderer "%s", use one of %s' % (
+                    renderer_name,
+                    ', '.join(sorted(renderers.RENDERERS))), True)
+            # The error only exits when it is shown
+            raise
+        except ImportError, e:
+            self.error('the %s renderer is not available: %s' % (
+                    renderer_name, e), True)
+            raise
+
+        # The drawing quality is lowered when frames take longer than
+        # the frame rate allows, unless a tier is pinned
+        try:
+            tier = governor.parse_tier(self.quality_tier)
+        except ValueError:
+            self.error('unknown quality tier "%s", use auto or one of %s' % (
+                    self.quality_tier, ', '.join(
+                        '%d (%s)' % x for x in
+                        enumerate(governor.TIER_NAMES))), True)
+            raise
+        if tier is None:
+            self.governor = governor.QualityGovernor(
+                1000.0 / float(self.max_fps or governor.DEFAULT_TARGET_FPS))
+            tier = governor.FULL
+        else:
+            self.governor = None
+        self.current_quality_tier = tier
+        # How many milliseconds of animation a pose is shown for, if
+        # not all of them are drawn
+        self.animation_step = None
+
+        # The time of the simulation in milliseconds
+        self.sim_time = 0.0
+
+        # Frames are only timed when someone is going to look at the
+        # timings; otherwise marking a phase does nothing.
+        if self.show_debug or self.show_timing_hud or self.timing_file:
+            self.frame_timer = FrameTimer(self.timing_samples)
+        else:
+            self.frame_timer = None
+            self.mark_phase = various.nothing
+        self.timing_hud = None
+        self.timing_hud_frame = 0
 
         self.levels = options.get('levels') or []
+        self.current_level = None
+        # (sim time, kind, value) inputs not yet given to the level
+        self.inputs = []
+
+        self.sound_bank = None
+        # When the keys of the sounds being played were pressed, and
+        # how long it took
+        self.input_time = None
+        if self.measure_sound_latency:
+            self.sound_latencies = []
+        else:
+            self.sound_latencies = None
+
+        self.recorder = None
+        if self.replay_path is not None:
+            try:
+                recording = Recording.load(self.replay_path)
+            except (IOError, ValueError), e:
+                self.error('could not load recording: %s' % e, True)
+            self.replayer = Replayer(recording, self.data_dir)
+            # The recording only replays the same with the same steps
+            self.sim_rate = recording.sim_rate
+            if not self.levels:
+                self.levels = recording.level_paths(self.data_dir)
+        else:
+            self.replayer = None
+
+        if self.use_level_cache:
+            self.level_cache = LevelCache(self.level_cache_dir,
+                                          self.rebuild_level_cache)
+        else:
+            self.level_cache = None
+
+        if self.use_sprite_cache:
+            self.sprite_cache = SpriteCache(
+                int(float(self.sprite_cache_size) * 1024 * 1024))
+        else:
+            self.sprite_cache = None
 
         if self.disp_size is not None:
                     # Parse display size input
@@ -100,16 +242,54 @@ class World(SettingsParser):
         if self.term_verbose:
             print ginfo.program_name + ': ' + msg
 
+    def get_time(self):
+        """Get the current simulation time in milliseconds"""
+        return self.sim_time
+
+    def read_level(self, path):
+        """Get the parsed data of a level file"""
+        if self.level_cache is not None:
+            return self.level_cache.read(path)
+        return read_level_data(path)
+
     def create_level(self, path):
-        return Level(self, path)
+        return LevelHandle(self, path)
 
     def set_current_level(self, num):
+        if self.recorder is not None and self.current_level is not None:
+            self.recorder.state(self.sim_time, self.current_level)
         if num is None:
             self.current_level = None
         else:
-            self.current_level = self.levels[num]
+            self.current_level = self.levels[num].get()
         self.current_level_index = num
+        self.inputs = []
         self.current_level.switch_hook()
+        self.update_loaded_levels()
+        if self.recorder is not None:
+            self.recorder.level(self.sim_time, self.levels[num].path,
+                                self.current_level.status)
+
+    def update_loaded_levels(self):
+        """
+        Load the levels next to the current one in the background, and
+        unload those further away than level_window
+        """
+        n = len(self.levels)
+        window = max(1, int(self.level_window))
+        if self.replayer is not None:
+            # Levels must stay as they were played
+            window = n
+        current = self.current_level_index
+        for i in range(n):
+            # Going forwards wraps around, going backwards does not
+            dist = (i - current) % n
+            if i < current:
+                dist = min(dist, current - i)
+            if dist == 1:
+                self.levels[i].prefetch()
+            elif dist > window:
+                self.levels[i].evict()
 
     def previous_level(self):
         if self.current_level_index > 0:
@@ -120,6 +300,75 @@ class World(SettingsParser):
         self.set_current_level((self.current_level_index + 1) %
                                len(self.levels))
 
+    def press_letter(self, letter, at=None):
+        """Type a letter at the sim time at, by default now"""
+        if at is None:
+            at = self.sim_time
+        self.inputs.append((at, KEY, letter))
+
+    def set_laser(self, on, at=None):
+        """Turn the laser on or off at the sim time at, by default now"""
+        if at is None:
+            at = self.sim_time
+        self.inputs.append((at, LASER, on))
+        if on:
+            self.play_sound('laser')
+
+    def take_inputs(self):
+        """Get the inputs due in the update to the current sim time"""
+        inputs, self.inputs = split_inputs(self.inputs, self.sim_time)
+        if self.recorder is not None:
+            for time, kind, value in inputs:
+                if kind == KEY:
+                    self.recorder.key(time, value)
+                else:
+                    self.recorder.laser(time, value)
+        return inputs
+
+    def event_time(self, event, read_time, clock):
+        """
+        Get the sim time of an input event read at read_time. clock is
+        (real time, sim time) of one moment. SDL 1.2 events have no
+        timestamp, so they are placed at when they were read; events
+        with one (in pygame.time.get_ticks milliseconds) at it.
+        """
+        stamp = getattr(event, 'timestamp', None)
+        if stamp is not None:
+            read_time -= (pygame.time.get_ticks() - stamp) / 1000.0
+        real_time, sim_time = clock
+        return max(self.sim_time,
+                   sim_time + (read_time - real_time) * 1000.0)
+
+    def play_sound(self, name):
+        if self.sound_bank is None:
+            return
+        self.sound_bank.play(name)
+        if self.sound_latencies is not None and \
+                self.input_time is not None and name in INPUT_SOUNDS:
+            self.sound_latencies.append(
+                (various.monotonic_time() - self.input_time) * 1000.0)
+
+    def restart_level(self):
+        if self.recorder is not None:
+            self.recorder.state(self.sim_time, self.current_level)
+            self.recorder.restart(self.sim_time)
+        self.inputs = []
+        self.current_level.start()
+
+    def replay_level(self, path, status):
+        """Switch to a level as it was switched to in a recording"""
+        path = os.path.abspath(path)
+        for i, x in enumerate(self.levels):
+            if os.path.abspath(x.path) == path:
+                break
+        else:
+            self.levels.append(self.create_level(path))
+            i = len(self.levels) - 1
+        self.set_current_level(i)
+        if status == PLAYING and self.current_level.status != PLAYING:
+            # It was loaded anew when it was recorded
+            self.current_level.start()
+
     def accepts_filename(self, fn):
         for x in INVALID_FILENAMES:
             if fnmatch.fnmatch(fn, x):
@@ -128,19 +377,33 @@ class World(SettingsParser):
         return True
 
     def start(self):
+        self.setup()
+        if not self.mute:
+            pygame.mixer.music.load(
+                os.path.join(self.data_dir, 'music', 'bgmusic.ogg'))
+            pygame.mixer.music.play(-1)
+        self.run()
+
+    def setup(self):
+        """Open the window and load the first level"""
         pygame.display.init()
         pygame.font.init()
-        pygame.mixer.pre_init(44100) # Sound files must be resampled
-        pygame.mixer.init()          # to 44.1 kHz
+        # Sound files must be resampled to 44.1 kHz. A small buffer
+        # makes sounds start sooner after they are played.
+        pygame.mixer.pre_init(44100, -16, 2, int(self.mixer_buffer))
+        pygame.mixer.init()
+        if not self.mute:
+            self.sound_bank = SoundBank(self.data_dir)
 
         self.create_screen()
+        self.set_quality_tier(self.current_quality_tier)
 
         pygame.display.set_caption(ginfo.program_name)
         pygame.mouse.set_visible(False)
 
-        self.std_font = pygame.font.Font(
+        self.glyph_atlas = GlyphAtlas(
             os.path.join(self.data_dir, 'fonts',
-            'UniversalisADFCdStd-Bold.otf'), 250)
+            'UniversalisADFCdStd-Bold.otf'))
 
         if not self.levels:
             for x in os.walk(os.path.join(self.data_dir, 'levels')):
@@ -150,6 +413,11 @@ class World(SettingsParser):
             self.levels.sort()
                         
         self.levels = [self.create_level(x) for x in self.levels]
+        if self.record_path is not None:
+            try:
+                self.recorder = Recorder(self.record_path, self.sim_rate)
+            except IOError, e:
+                self.error('could not record: %s' % e)
         self.set_current_level(0)
 
         self.shooting = False
@@ -160,14 +428,26 @@ class World(SettingsParser):
         else:
             self.tick = self.clock.tick
 
-        if not self.mute:
-            pygame.mixer.music.load(
-                os.path.join(self.data_dir, 'music', 'bgmusic.ogg'))
-            pygame.mixer.music.play(-1)
-        self.run()
-
     def end(self):
-        pass
+        if self.recorder is not None:
+            if self.current_level is not None:
+                self.recorder.state(self.sim_time, self.current_level)
+            self.recorder.close(self.sim_time)
+            self.recorder = None
+        if self.replayer is not None:
+            self.status(self.replayer.report())
+        if self.level_cache is not None:
+            self.status(self.level_cache.report())
+        if self.sound_latencies:
+            self.status(self.sound_latency_report())
+        if self.frame_timer is not None and self.frame_timer.count:
+            if self.show_debug:
+                self.print_debug_information()
+            if self.timing_file:
+                try:
+                    self.frame_timer.dump(self.timing_file)
+                except IOError, e:
+                    self.error('could not save frame timings: %s' % e)
 
     def create_screen(self):
         # The screen is by default just a window of the same
@@ -221,7 +501,9 @@ class World(SettingsParser):
             self.status('Modified size of game is: %dx%d' % tuple(self.window_size))
             if not self.use_border or self.use_fakefullscreen:
                 flags = NOFRAME
-            if self.use_doublebuf:
+            # Only updating parts of the screen does not work well
+            # with swapping buffers.
+            if self.use_doublebuf and not self.use_dirty_rects:
                 if flags is not 0:
                     flags |= DOUBLEBUF
                 else:
@@ -242,7 +524,7 @@ class World(SettingsParser):
                 self.window_size = self.virtual_size
             if not self.use_border or self.use_fakefullscreen:
                 flags = NOFRAME
-            if self.use_doublebuf:
+            if self.use_doublebuf and not self.use_dirty_rects:
                 if flags is not 0:
                     flags = flags | DOUBLEBUF
                 else:
@@ -262,7 +544,7 @@ class World(SettingsParser):
         # Finally create the screen
         self.screen = pygame.display.set_mode(self.window_size, flags,
                                               32)
-        cairogame.set_screen(self.screen)
+        self.renderer.set_screen(self.screen)
         if barsize is not None:
             self.screen_bars[b] = pygame.Surface(barsize).convert()
             self.screen_bars[b].fill((255, 255, 255))
@@ -271,47 +553,197 @@ class World(SettingsParser):
         self.bgsurface = pygame.Surface(self.window_size).convert()
         self.bgsurface.fill((0, 0, 0))
 
+        # The part of the screen that is not covered by bars
+        self.play_rect = pygame.Rect(self.screen_offset, self.real_size)
+        # The rects drawn on in the current and in the previous frame
+        self.dirty_rects = []
+        self.prev_dirty_rects = []
+        self.full_redraw = True
+
+        # The window, and how the game is placed in it. The game is
+        # drawn directly on it unless a render scale is set.
+        self.display = self.screen
+        self.display_zoom = self.disp_zoom
+        self.display_offset = self.screen_offset
+        self.display_size = self.real_size
+        self.display_rect = self.play_rect
+        self.display_area = None
+        self.current_render_scale = None
+        if self.render_scale:
+            self.set_render_scale(self.render_scale)
+
+    def set_render_scale(self, scale):
+        """
+        Draw frames at scale times the virtual size and scale them to
+        fit the window, or draw directly on the window if scale is None
+        """
+        scale = scale and max(1, int(scale)) or None
+        if scale == self.current_render_scale:
+            return
+        self.current_render_scale = scale
+        if scale is None:
+            self.screen = self.display
+            self.disp_zoom = self.display_zoom
+            self.screen_offset = self.display_offset
+            self.real_size = self.display_size
+            self.play_rect = self.display_rect
+            self.display_area = None
+        else:
+            self.disp_zoom = scale
+            self.screen_offset = [0, 0]
+            self.real_size = [x * scale for x in self.virtual_size]
+            self.screen = pygame.Surface(self.real_size).convert()
+            self.play_rect = self.screen.get_rect()
+            self.display_area = self.display.subsurface(self.display_rect)
+        self.renderer.set_screen(self.screen)
+        self.status('Drawing the game at %dx%d' % tuple(self.real_size))
+        self.timing_hud = None
+        self.full_redraw = True
+        # Text must be rendered again at the new zoom
+        for x in self.levels:
+            if isinstance(x, LevelHandle) and x.is_loaded():
+                x.level.render_text()
+
+    def set_quality_tier(self, tier):
+        """Draw at one of the quality tiers of shadowloss.governor"""
+        self.current_quality_tier = tier
+        antialias = tier < governor.NO_ANTIALIASING
+        if antialias != self.renderer.antialias:
+            self.renderer.set_antialias(antialias)
+            self.clear_sprite_cache()
+        self.set_render_scale(self.quality_render_scale())
+        if tier >= governor.COARSE_ANIMATION:
+            self.animation_step = governor.COARSE_ANIMATION_STEP
+        else:
+            self.animation_step = None
+        self.debug_print('quality tier %d (%s)' % (
+                tier, governor.TIER_NAMES[tier]))
+
+    def quality_render_scale(self):
+        """Get the render scale of the current quality tier"""
+        if self.current_quality_tier < governor.LOW_RESOLUTION:
+            return self.render_scale
+        # Half the resolution of the window, or less
+        scale = max(1, int(self.display_zoom / 2))
+        if self.render_scale:
+            scale = min(scale, max(1, int(self.render_scale)))
+        elif scale >= self.display_zoom:
+            # The window is no bigger
+            return None
+        return scale
+
     def debug_print(self, text):
         if self.show_debug:
             print text
 
     def run(self):
+        # The level is updated in fixed steps, as many as needed to
+        # catch up with the clock (but never more than max_sim_steps
+        # per frame), and drawn between the last two steps. Inputs are
+        # applied at their sim times inside the steps that reach them.
+        step = 1000.0 / float(self.sim_rate)
+        max_steps = int(self.max_sim_steps)
+        accumulator = 0.0
+        prev_time = various.monotonic_time()
         done = False
         while not done:
-            if self.show_debug:
-                self.print_debug_information()
+            if self.frame_timer is not None:
+                self.frame_timer.start_frame()
 
-            letters = []
-            for x in pygame.event.get():
+            events = pygame.event.get()
+            read_time = various.monotonic_time()
+            # The clock not yet simulated is accumulator ahead
+            clock = (prev_time, self.sim_time + accumulator)
+            for x in events:
                 if x.type == KEYDOWN:
+                    if self.input_time is None:
+                        self.input_time = read_time
                     if x.key == K_ESCAPE:
                         done = True
+                    if self.replayer is not None:
+                        # The recording does the playing
+                        continue
                     if self.current_level.status == PLAYING:
+                        at = self.event_time(x, read_time, clock)
                         if x.key == K_SPACE:
-                            self.shooting = True
+                            self.set_laser(True, at)
                         else:
                             letter = x.unicode.lower()
                             if letter:
-                                letters.append(letter)
+                                self.press_letter(letter, at)
                     else:
                         if x.key == K_SPACE or x.key == K_RIGHT:
                             self.next_level()
                         elif x.key == K_LEFT:
                             self.previous_level()
                         elif x.key == K_r:
-                            self.current_level.start()
+                            self.restart_level()
                 elif x.type == KEYUP:
-                    if x.key == K_SPACE:
+                    if x.key == K_SPACE and self.replayer is None:
                         if self.current_level.status == PLAYING:
-                            self.shooting = False
+                            self.set_laser(
+                                False, self.event_time(x, read_time, clock))
                 elif x.type == QUIT:
                     done = True
-            self.current_level.update(letters)
-            self.draw()
+            self.mark_phase('events')
+
+            now = various.monotonic_time()
+            accumulator += (now - prev_time) * 1000.0
+            prev_time = now
+            steps = 0
+            while accumulator >= step:
+                if steps == max_steps:
+                    # Give up catching up instead of spiralling, and
+                    # have the inputs of the lost time in the next step
+                    accumulator = 0.0
+                    self.inputs = [(min(x[0], self.sim_time),) + x[1:]
+                                   for x in self.inputs]
+                    break
+                if self.replayer is not None:
+                    self.replayer.apply(self, self.sim_time,
+                                        self.sim_time + step)
+                    if self.replayer.finished:
+                        done = True
+                        break
+                self.sim_time += step
+                self.current_level.update((), self.sim_time,
+                                          self.take_inputs())
+                self.input_time = None
+                accumulator -= step
+                steps += 1
+            self.mark_phase('update')
+            self.draw(accumulator / step)
+            if self.governor is not None:
+                tier = self.governor.add(
+                    (various.monotonic_time() - read_time) * 1000.0)
+                if tier is not None:
+                    self.set_quality_tier(tier)
             self.tick()
+            self.mark_phase('wait')
+
+    def sound_latency_report(self):
+        """
+        Summarize the time from key presses being read to their sounds
+        being played, plus the time the mixer buffer adds
+        """
+        values = sorted(self.sound_latencies)
+        extra = buffer_latency(int(self.mixer_buffer))
+        return 'sound latency of %d sounds: p50 %.1f ms, p95 %.1f ms, ' \
+            'p99 %.1f ms (%.1f ms of it in the mixer buffer)' % (
+            (len(values),) + tuple(percentile(values, p) + extra
+                                   for p in (50, 95, 99)) + (extra,))
 
     def print_debug_information(self):
-        print 'FPS:', self.clock.get_fps()
+        print self.frame_timer.report()
+        if self.sprite_cache is not None:
+            print self.sprite_cache.stats()
+        print self.glyph_atlas.stats()
+        if self.governor is not None:
+            print self.governor.report()
+        else:
+            print 'quality tier: %d (%s), pinned' % (
+                self.current_quality_tier,
+                governor.TIER_NAMES[self.current_quality_tier])
 
     # Programmer's note: Sorry about all these different
     # point-to-another-point functions. It is messy.
@@ -355,7 +787,8 @@ class World(SettingsParser):
         x_real=None, y_real=None):
         radius = int(radius * self.disp_zoom)
         pos = self.true_point(pos, man_pos, x_real, y_real)
-        cairogame.draw_circle(color, pos, radius)
+        self.renderer.queue_circle(color, pos, radius)
+        self.mark_dirty_shape(pos, pos, radius)
         return pos
 
     def draw_line(self, p1, p2, line_width, color=(255, 255, 255),
@@ -364,23 +797,127 @@ class World(SettingsParser):
             p1 = self.true_point(p1)
             p2 = self.true_point(p2)
         line_width *= self.disp_zoom
-        cairogame.draw_line(color, p1, p2, line_width)
+        self.renderer.queue_line(color, p1, p2, line_width)
+        self.mark_dirty_shape(p1, p2, line_width / 2)
         return p1, p2
 
     def draw_stickfigure_line(self, p1, p2, body_rect, color=(255, 255, 255)):
         p1 = self.center_point(p1, body_rect)
         p2 = self.center_point(p2, body_rect)
         line_width = 3 * self.disp_zoom
-        cairogame.draw_line(color, p1, p2, line_width)
+        self.renderer.queue_line(color, p1, p2, line_width)
+        self.mark_dirty_shape(p1, p2, line_width / 2)
 
     def draw_stickfigure_circle(self, pos, radius, body_rect, color=(255, 255, 255)):
         pos = self.center_point(pos, body_rect)
         radius = int(radius * self.disp_zoom)
-        cairogame.draw_circle(color, pos, radius)
+        self.renderer.queue_circle(color, pos, radius)
+        self.mark_dirty_shape(pos, pos, radius)
         return pos
 
+    def draw_stickfigure(self, figure, step, speed, color=(255, 255, 255)):
+        """
+        Draw a stickfigure, using a prerendered sprite if one exists.
+        Returns the objects, points and size of the drawn pose.
+        """
+        if self.animation_step:
+            step -= step % self.animation_step
+        cache = self.sprite_cache
+        if cache is None or figure.pose_cache is None:
+            return figure.draw(step, speed, color)
+
+        # Draw the pose that the sprite will show, not the exact one,
+        # so that the eye is always placed correctly.
+        cache.check_zoom(self.disp_zoom)
+        step = cache.quantize_step(step)
+        speed_bucket = figure.pose_cache.speed_bucket(speed)
+        speed = speed_bucket * figure.pose_cache.speed_resolution
+        key = figure, step, speed_bucket, color, self.disp_zoom
+        objs, points, size = figure.generate_body(step, speed)
+        sprite = cache.get(key)
+        if sprite is None:
+            # Render the pose only once, to the sprite that is drawn
+            sprite = self.render_stickfigure_sprite(objs, color)
+            cache.add(key, *sprite)
+        surf, point = sprite
+        self.flush_shapes()
+        self.mark_dirty(self.renderer.blit(
+                self.screen, surf, self.center_point(point, size)))
+        return objs, points, size
+
+    def draw_ghosts(self, figure, shifts, steps, speeds,
+                    color=(255, 255, 255)):
+        """
+        Draw a stickfigure in many poses at once, pose i shifts[i]
+        virtual units to the right of the center
+        """
+        if not shifts:
+            return
+        if self.animation_step:
+            steps = [x - x % self.animation_step for x in steps]
+        bodies = ghosts.pose_many(figure, steps, speeds)
+        lines, circles = bodies.shapes(shifts, self.disp_zoom,
+                                       self.virtual_size, self.screen_offset)
+        line_width = 3 * self.disp_zoom
+        self.renderer.queue_lines(color, lines, line_width)
+        self.renderer.queue_circles(color, circles)
+        if self.use_dirty_rects:
+            for start, end in lines:
+                self.mark_dirty_shape(start, end, line_width / 2)
+            for pos, radius in circles:
+                self.mark_dirty_shape(pos, pos, radius)
+
+    def render_stickfigure_sprite(self, objs, color=(255, 255, 255)):
+        """
+        Render stickfigure objects to a surface. Returns the surface
+        and the point of the stickfigure that its top left corner
+        should be placed at.
+        """
+        pad = 3
+        xs = []
+        ys = []
+        for x in objs:
+            if x[0] == LINE and x[3]:
+                xs.extend((x[1][0], x[2][0]))
+                ys.extend((x[1][1], x[2][1]))
+            elif x[0] == CIRCLE:
+                xs.extend((x[1][0] - x[2], x[1][0] + x[2]))
+                ys.extend((x[1][1] - x[2], x[1][1] + x[2]))
+        left = min(xs) - pad
+        top = max(ys) + pad
+        size = (int(math.ceil((max(xs) + pad - left) * self.disp_zoom)),
+                int(math.ceil((top - min(ys) + pad) * self.disp_zoom)))
+        surf = pygame.Surface(size, SRCALPHA, 32)
+
+        point = lambda p: ((p[0] - left) * self.disp_zoom,
+                           (top - p[1]) * self.disp_zoom)
+        for x in objs:
+            if x[0] == LINE and x[3]:
+                self.renderer.queue_line(color, point(x[1]), point(x[2]),
+                                         3 * self.disp_zoom, surf)
+            elif x[0] == CIRCLE:
+                self.renderer.queue_circle(color, point(x[1]),
+                                           int(x[2] * self.disp_zoom), 0,
+                                           surf)
+        self.renderer.flush(surf)
+        # Cairo leaves premultiplied colors, which PyGame would blit
+        # darkened at the edges. The sprite has only one color, so
+        # setting every pixel to it gives the straight colors.
+        surf.fill(color, special_flags=BLEND_RGB_MAX)
+        return surf.convert_alpha(), (left, top)
+
+    def clear_sprite_cache(self):
+        if self.sprite_cache is not None:
+            self.sprite_cache.invalidate()
+
     def finish_stickfigure_draw(self):
-        cairogame.finish_draw()
+        # The stickfigure is queued with the rest of the frame's
+        # shapes, so it may not be drawn until flush_shapes is called.
+        pass
+
+    def flush_shapes(self):
+        """Draw all queued shapes"""
+        self.renderer.flush()
 
     def draw_wall(self, start, end, color=(255, 255, 255)):
         start = self.real_point(start, 0)
@@ -392,40 +929,158 @@ class World(SettingsParser):
         end[1] += self.real_size[1]
         size = [end[i] - start[i] for i in range(2)]
         rect = pygame.Rect(start, size)
-        pygame.draw.rect(self.screen, color, rect)
+        self.flush_shapes()
+        self.mark_dirty(self.renderer.fill_rect(self.screen, color, rect))
+
+    def text_size(self, text, text_height=75):
+        """Get the size of a text in virtual units"""
+        return self.glyph_atlas.text_size(text, text_height)
 
     def create_text(self, text, text_height=75, color=(255, 255,
     255)):
-        surf = self.std_font.render(text, True, color)
-        size = surf.get_size()
-        text_height *= self.disp_zoom
-        ratio = size[1] / text_height
-        size = int(size[0] / ratio), int(text_height)
-        surf = pygame.transform.smoothscale(surf, size)
-        return surf
+        return self.glyph_atlas.render(text, text_height * self.disp_zoom,
+                                       color)
 
     def blit(self, surf, pos):
-        self.screen.blit(surf, self.normal_point(pos, surf.get_size()))
+        self.flush_shapes()
+        self.mark_dirty(self.renderer.blit(
+                self.screen, surf, self.normal_point(pos, surf.get_size())))
+
+    def mark_dirty(self, rect):
+        """Note that a part of the screen has been drawn on"""
+        if self.use_dirty_rects and rect.width and rect.height:
+            self.dirty_rects.append(rect)
+
+    def mark_dirty_shape(self, p1, p2, extent):
+        """Note that a shape between two points has been drawn"""
+        if self.use_dirty_rects:
+            extent = int(math.ceil(extent)) + 1
+            left = int(min(p1[0], p2[0])) - extent
+            top = int(min(p1[1], p2[1])) - extent
+            rect = pygame.Rect(left, top,
+                               int(max(p1[0], p2[0])) + extent - left + 1,
+                               int(max(p1[1], p2[1])) + extent - top + 1)
+            self.mark_dirty(rect.clip(self.play_rect))
+
+    def mark_phase(self, phase):
+        """Note that a phase of the frame has ended"""
+        # Draw what the phase queued so that it is timed as part of it
+        self.flush_shapes()
+        self.frame_timer.mark(phase)
+
+    def draw_timing_hud(self):
+        """Draw the frame time percentiles in the top left corner"""
+        timer = self.frame_timer
+        # Sorting the samples is too slow to do in every frame
+        if self.timing_hud is None or \
+                timer.count - self.timing_hud_frame >= 30:
+            self.timing_hud = self.render_timing_hud(timer.stats(),
+                                                     timer.counter_stats())
+            self.timing_hud_frame = timer.count
+        # When frames are scaled, the HUD is drawn on top at its own
+        # size
+        self.mark_dirty(self.renderer.blit(self.display, self.timing_hud,
+                                           self.display_offset))
+
+    def render_timing_hud(self, stats, counts=()):
+        height = 10
+        rows = [('', 'p50', 'p95', 'p99')] + \
+            [(x[0],) + tuple('%.1f' % y for y in x[1:]) for x in stats] + \
+            [(x[0],) + tuple('%d' % y for y in x[1:]) for x in counts]
+        rows = [[self.create_text(text, height) for text in row]
+                for row in rows]
+        pad = int(3 * self.disp_zoom)
+        widths = [max(row[i].get_width() for row in rows) + pad
+                  for i in range(4)]
+        line_height = max(row[0].get_height() for row in rows)
+        surf = pygame.Surface((sum(widths) + pad,
+                               line_height * len(rows) + pad * 2)).convert()
+        surf.fill((0, 0, 0))
+        for i, row in enumerate(rows):
+            x = pad
+            for j, text in enumerate(row):
+                # Names are left-aligned, numbers right-aligned
+                if j == 0:
+                    surf.blit(text, (x, pad + i * line_height))
+                else:
+                    surf.blit(text, (x + widths[j] - pad - text.get_width(),
+                                     pad + i * line_height))
+                x += widths[j]
+        return surf
 
     def fill_borders(self, color=(255, 255, 255)):
         for x in self.screen_bars:
             if x is not None:
                 x.fill(color)
+        self.full_redraw = True
 
-    def draw(self):
-        self.screen.blit(self.bgsurface, (0, 0))
+    def draw(self, alpha=1.0):
+        self.renderer.begin_frame(self.screen)
+        # Scaled frames are always drawn in full
+        full = not self.use_dirty_rects or self.full_redraw or \
+            self.display_area is not None
+        if full:
+            self.renderer.blit(self.screen, self.bgsurface, (0, 0))
+        else:
+            # Only erase what was drawn in the last frame, and do not
+            # draw on the bars
+            for x in self.prev_dirty_rects:
+                self.renderer.blit(self.screen, self.bgsurface, x, x)
+            self.screen.set_clip(self.play_rect)
+        del self.dirty_rects[:]
+        self.mark_phase('clear')
         
-        self.current_level.draw()
+        self.current_level.draw(alpha)
+        self.flush_shapes()
+        if self.frame_timer is not None:
+            self.frame_timer.tally('culled', self.current_level.culled)
+
+        if not full:
+            self.mark_phase('walls')
+            if self.show_timing_hud:
+                self.draw_timing_hud()
+                self.mark_phase('hud')
+            self.screen.set_clip(None)
+            self.update_dirty_rects()
+            self.mark_phase('flip')
+            return
+
+        if self.display_area is not None:
+            self.renderer.scale(self.screen, self.display_area,
+                                self.use_smooth_scaling)
+            self.mark_phase('scale')
 
         if self.screen_bars[0] is not None:
-            self.screen.blit(self.screen_bars[0], (0, 0))
-            self.screen.blit(self.screen_bars[0],
-                             (self.window_size[0] -
-                              self.screen_bars[0].get_size()[0], 0))
+            self.renderer.blit(self.display, self.screen_bars[0], (0, 0))
+            self.renderer.blit(self.display, self.screen_bars[0],
+                               (self.window_size[0] -
+                                self.screen_bars[0].get_size()[0], 0))
         if self.screen_bars[1] is not None:
-            self.screen.blit(self.screen_bars[1], (0, 0))
-            self.screen.blit(self.screen_bars[1],
-                             (0, self.window_size[1] -
-                              self.screen_bars[1].get_size()[1]))
+            self.renderer.blit(self.display, self.screen_bars[1], (0, 0))
+            self.renderer.blit(self.display, self.screen_bars[1],
+                               (0, self.window_size[1] -
+                                self.screen_bars[1].get_size()[1]))
+        self.mark_phase('walls')
+
+        if self.show_timing_hud:
+            self.draw_timing_hud()
+            self.mark_phase('hud')
 
-        pygame.display.flip()
+        self.renderer.flip()
+        self.mark_phase('flip')
+        self.prev_dirty_rects = self.dirty_rects[:]
+        self.full_redraw = False
+
+    def update_dirty_rects(self):
+        """
+        Show the parts of the screen that were drawn on in this or the
+        last frame, or all of it if that is most of the screen anyway
+        """
+        rects = self.prev_dirty_rects + self.dirty_rects
+        area = sum([x.width * x.height for x in rects])
+        if area > float(self.dirty_rect_threshold) * \
+                self.window_size[0] * self.window_size[1]:
+            self.renderer.flip()
+        else:
+            self.renderer.update(rects)
+        self.prev_dirty_rects = self.dirty_rects[:]